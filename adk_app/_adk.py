@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import uuid
+from typing import AsyncIterator, Callable, Dict, Tuple
+
+from google.adk import Agent
+from google.adk.runners import Runner
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.genai.types import Content, Part
+
+_USER_ID = "local_user"
+
+# The runner's agent holds model clients whose async HTTP transports bind to the event loop that first
+# used them, and every sync entry point runs on its own asyncio.run() loop; so runners are kept per loop,
+# and entries for loops that have since closed are dropped on the next lookup.
+_runners: Dict[asyncio.AbstractEventLoop, Dict[Tuple[str, str], Tuple[Runner, InMemorySessionService]]] = {}
+_runners_lock = threading.Lock()
+
+
+def get_runner(
+    app_name: str, agent_factory: Callable[[], Agent], variant: str = ""
+) -> Tuple[Runner, InMemorySessionService]:
+    """Return the running loop's Runner and session service for ``app_name``, building them on first use.
+
+    ``variant`` distinguishes agents built differently under one app name (e.g. per model).
+    """
+    loop = asyncio.get_running_loop()
+    key = (app_name, variant)
+    with _runners_lock:
+        for closed in [lp for lp in _runners if lp.is_closed()]:
+            del _runners[closed]
+        loop_runners = _runners.setdefault(loop, {})
+        entry = loop_runners.get(key)
+        if entry is None:
+            session_service = InMemorySessionService()
+            runner = Runner(app_name=app_name, agent=agent_factory(), session_service=session_service)
+            entry = loop_runners[key] = (runner, session_service)
+    return entry
+
+
+async def run_agent_stream(
+    app_name: str, agent_factory: Callable[[], Agent], prompt: str, variant: str = ""
+) -> AsyncIterator[str]:
+    """Yield the agent's text chunks for ``prompt`` in a fresh session on the loop's shared runner.
+
+    Each request gets its own uuid4 session so histories stay isolated; the session is dropped afterwards
+    so the in-memory service does not grow with every call.
+    """
+    runner, session_service = get_runner(app_name, agent_factory, variant)
+    session_id = uuid.uuid4().hex
+    await session_service.create_session(app_name=app_name, user_id=_USER_ID, session_id=session_id)
+    try:
+        msg = Content(role="user", parts=[Part.from_text(text=prompt)])
+        async for ev in runner.run_async(user_id=_USER_ID, session_id=session_id, new_message=msg):
+            txt = getattr(ev, "text", None)
+            if txt:
+                yield txt
+    finally:
+        try:
+            await session_service.delete_session(app_name=app_name, user_id=_USER_ID, session_id=session_id)
+        except Exception:
+            pass
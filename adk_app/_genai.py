@@ -0,0 +1,64 @@
+import asyncio
+import functools
+import os
+import threading
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+
+def _api_key() -> Optional[str]:
+    return os.environ.get("GOOGLE_API_KEY") or os.environ.get("GENAI_API_KEY")
+
+
+@functools.lru_cache(maxsize=2)
+def _client_for_key(api_key: str):
+    from google.genai import Client  # type: ignore
+    return Client(api_key=api_key)
+
+
+def get_genai_client():
+    """Return the shared google-genai client used for sync Google AI API fallbacks, or None without an API key.
+
+    One client per key is kept for the life of the process so its HTTP session and TLS connection are reused.
+    Only its sync surface is shared; async callers use :func:`get_genai_aio_client`.
+    """
+    api_key = _api_key()
+    if not api_key:
+        return None
+    return _client_for_key(api_key)
+
+
+# Async sessions bind to the loop that opened them and each sync entry point runs its own asyncio.run()
+# loop, so async clients are kept per loop; entries for loops that have since closed are dropped.
+_aio_clients: Dict[Tuple[asyncio.AbstractEventLoop, str], object] = {}
+_aio_clients_lock = threading.Lock()
+
+
+def get_genai_aio_client():
+    """Return the running loop's async google-genai client (``Client(...).aio``), or None without an API key."""
+    api_key = _api_key()
+    if not api_key:
+        return None
+    key = (asyncio.get_running_loop(), api_key)
+    with _aio_clients_lock:
+        for closed in [k for k in _aio_clients if k[0].is_closed()]:
+            del _aio_clients[closed]
+        client = _aio_clients.get(key)
+        if client is None:
+            from google.genai import Client  # type: ignore
+            client = _aio_clients[key] = Client(api_key=api_key).aio
+    return client
+
+
+async def stream_generate_content(model: str, prompt: str) -> AsyncIterator[str]:
+    """Yield text deltas from the Google AI API fallback; yields nothing when unavailable or on error."""
+    try:
+        client = get_genai_aio_client()
+        if client is None:
+            return
+        stream = await client.models.generate_content_stream(model=model, contents=prompt)
+        async for chunk in stream:
+            txt = getattr(chunk, "text", None)
+            if txt:
+                yield txt
+    except Exception:
+        return
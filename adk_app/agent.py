@@ -1,17 +1,18 @@
 from google.adk import Agent
 from google.adk.tools.function_tool import FunctionTool
-from google.adk.runners import Runner
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.genai.types import Content, Part
-import os
 import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+from ._adk import run_agent_stream
+from ._genai import get_genai_client, stream_generate_content
 from .schemas import AuditInput, OptimizeInput, AnalyzeInput, QueryAnalysisInput
-from google.cloud import bigquery
 from .tools.bq_audit_tool import bq_audit_tool
 from .tools.query_optimizer_tool import query_optimizer_tool
 from .tools.analyze_tool import analyze_tool
 from .tools.query_analysis_tool import query_analysis_tool
-from .tools.query_analysis_tool import _regex_extract_tables
+from .tools.query_analysis_tool import _regex_extract_tables_batch
+from .tools._bq_clients import get_bq_client
 
 
 def _bq_audit_tool_entry(
@@ -56,6 +57,46 @@ def _query_analysis_tool_entry(sql: str, project: str):
     return query_analysis_tool(QueryAnalysisInput(sql=sql, project=project))
 
 
+def _latest_local_sql(ai: AuditInput) -> Optional[str]:
+    """Return the most expensive audited SQL whose tables all live in local datasets, if any.
+
+    The audit query and the dataset listing are independent round-trips, so they run concurrently;
+    table extraction then scans all candidates in a single regex pass.
+    """
+    project = ai.project
+    bq_client = get_bq_client(project)
+    # Plain threads rather than asyncio: ADK invokes this tool from its own running event loop
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        res_fut = ex.submit(bq_audit_tool, ai)
+        datasets_fut = ex.submit(lambda: {d.dataset_id for d in bq_client.list_datasets(project=project)})
+        res, local_datasets = res_fut.result(), datasets_fut.result()
+    def _first_local(jobs) -> Optional[str]:
+        extracted = _regex_extract_tables_batch([j.query for j in jobs], project)
+        local_project = {project}
+        for j, tables in zip(jobs, extracted):
+            if not tables:
+                continue
+            # accept only if all tables are in the local project AND datasets exist locally
+            if {t.project or project for t in tables} != local_project:
+                continue
+            if {t.dataset for t in tables}.issubset(local_datasets):
+                return j.query
+        return None
+
+    def cost(j):
+        return (j.total_bytes_billed, j.total_slot_ms)
+
+    jobs = [j for j in res.jobs if (j.query or "").strip()]
+    # Most expensive by billed bytes then slot time; a match is usually among the first few
+    candidates = heapq.nlargest(max(ai.topn * 2, 20), jobs, key=cost)
+    sql = _first_local(candidates)
+    if sql is not None or len(candidates) == len(jobs):
+        return sql
+    # No match at the top: scan everything else, still most expensive first, in one more batch
+    seen = {id(j) for j in candidates}
+    return _first_local(sorted((j for j in jobs if id(j) not in seen), key=cost, reverse=True))
+
+
 def _query_analysis_latest_local_entry(
     project: str,
     days: int = 1,
@@ -75,23 +116,9 @@ def _query_analysis_latest_local_entry(
         topn=topn,
         outfile="./bq_job_stats_today.csv",
     )
-    res = bq_audit_tool(ai)
-    # Sort by billed bytes then slot time desc
-    candidates = sorted(res.jobs, key=lambda j: (j.total_bytes_billed, j.total_slot_ms), reverse=True)
-    # Preload local datasets list
-    bq_client = bigquery.Client(project=project)
-    local_datasets = {d.dataset_id for d in bq_client.list_datasets(project=project)}
-    for j in candidates:
-        sql = j.query or ""
-        if not sql.strip():
-            continue
-        tables = _regex_extract_tables(sql, project)
-        if not tables:
-            continue
-        # accept only if all tables are in the local project AND datasets exist locally
-        if all(((t.project or project) == project) for t in tables):
-            if all((t.dataset in local_datasets) for t in tables):
-                return query_analysis_tool(QueryAnalysisInput(sql=sql, project=project))
+    sql = _latest_local_sql(ai)
+    if sql:
+        return query_analysis_tool(QueryAnalysisInput(sql=sql, project=project))
     # If none found, return empty output with note
     return {
         "tables": [],
@@ -101,9 +128,9 @@ def _query_analysis_latest_local_entry(
 
 
 def load_agent() -> Agent:
-        agent = Agent(
-            name="bq_audit_agent",
-            model="gemini-2.5-flash-lite",
+    agent = Agent(
+        name="bq_audit_agent",
+        model="gemini-2.5-flash-lite",
         instruction=(
             "You are a BigQuery audit agent. Use tools to fetch job stats and summarize top-N costly queries."
         ),
@@ -121,9 +148,9 @@ def load_agent() -> Agent:
 
 def load_simple_optimizer_agent() -> Agent:
     """A lightweight agent that takes a SQL and asks Gemini for optimization tips."""
-        agent = Agent(
-            name="bq_sql_optimizer",
-            model="gemini-2.5-flash-lite",
+    agent = Agent(
+        name="bq_sql_optimizer",
+        model="gemini-2.5-flash-lite",
         instruction=(
             "You are a BigQuery SQL optimization assistant. Given a SQL query, provide concise, actionable"
             " recommendations to reduce cost and improve performance. Consider partitioning/clustering, pruning,"
@@ -136,39 +163,48 @@ def load_simple_optimizer_agent() -> Agent:
     return agent
 
 
+def _optimizer_fallback_prompt(sql: str) -> str:
+    return (
+        "You are a BigQuery SQL optimization assistant. Provide concise bullet-point recommendations "
+        "to reduce cost and improve performance. Consider partitioning, clustering, pruning, materialization, "
+        "avoiding SELECT *, approximate aggregations, limiting scanned columns, and using INFORMATION_SCHEMA.\n\n"
+        f"SQL to optimize:\n```sql\n{sql}\n```\n"
+    )
+
+
+async def _optimizer_agent_stream(sql: str) -> AsyncIterator[str]:
+    prompt = f"Optimize this BigQuery SQL:\n```sql\n{sql}\n```"
+    async for txt in run_agent_stream("local_bq_optimizer", load_simple_optimizer_agent, prompt):
+        yield txt
+
+
+async def optimize_sql_with_agent_stream(sql: str) -> AsyncIterator[str]:
+    """Stream the simple optimizer agent's response for the provided SQL, yielding text chunks as they arrive."""
+    produced = False
+    async for txt in _optimizer_agent_stream(sql):
+        produced = True
+        yield txt
+    if not produced:
+        # Fallback to direct Gemini API if ADK produced no text
+        async for txt in stream_generate_content("gemini-2.0-flash", _optimizer_fallback_prompt(sql)):
+            yield txt
+
+
 def optimize_sql_with_agent(sql: str) -> str:
     """Invoke the simple optimizer agent with the provided SQL and return the final text response."""
     async def _run() -> str:
-        agent = load_simple_optimizer_agent()
-        session_service = InMemorySessionService()
-        app_name = "local_bq_optimizer"
-        user_id = "local_user"
-        session_id = "local_session"
-        await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        runner = Runner(app_name=app_name, agent=agent, session_service=session_service)
-        user_msg = Content(role="user", parts=[Part.from_text(text=f"Optimize this BigQuery SQL:\n```sql\n{sql}\n```")])
         chunks: list[str] = []
-        async for ev in runner.run_async(user_id=user_id, session_id=session_id, new_message=user_msg):
-            txt = getattr(ev, "text", None)
-            if txt:
-                chunks.append(txt)
+        async for chunk in _optimizer_agent_stream(sql):
+            chunks.append(chunk)
         return "\n".join(chunks).strip()
     out = asyncio.run(_run())
     if out:
         return out
     # Fallback to direct Gemini API if ADK produced no text
     try:
-        from google.genai import Client  # type: ignore
-        api_key = os.environ.get("GOOGLE_API_KEY") or os.environ.get("GENAI_API_KEY")
-        if api_key:
-            client = Client(api_key=api_key)
-            prompt = (
-                "You are a BigQuery SQL optimization assistant. Provide concise bullet-point recommendations "
-                "to reduce cost and improve performance. Consider partitioning, clustering, pruning, materialization, "
-                "avoiding SELECT *, approximate aggregations, limiting scanned columns, and using INFORMATION_SCHEMA.\n\n"
-                f"SQL to optimize:\n```sql\n{sql}\n```\n"
-            )
-            resp = client.models.generate_content(model="gemini-2.0-flash", contents=prompt)
+        client = get_genai_client()
+        if client is not None:
+            resp = client.models.generate_content(model="gemini-2.0-flash", contents=_optimizer_fallback_prompt(sql))
             return (getattr(resp, "text", "") or "").strip()
     except Exception:
         pass
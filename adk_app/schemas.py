@@ -72,6 +72,7 @@ class QueryAnalysisOutput(BaseModel):
 class ForensicInput(BaseModel):
     md_path: str = Field(..., description="Path to schema_report.md")
     output_path: str = Field("./analysis_out/forensic_report.md", description="Path to save the forensic report")
+    top_sql: Optional[str] = Field(None, description="SQL to analyze (e.g. AuditOutput.top[0].query); read from the audit CSV when omitted")
 
 
 class ForensicOutput(BaseModel):
@@ -85,6 +86,7 @@ class AllJobsInspectorInput(BaseModel):
     days: int = Field(3, ge=1, description="Lookback window in days")
     limit: int = Field(200, ge=1, description="Max rows to pull from INFORMATION_SCHEMA.JOBS")
     output_path: str = Field("./analysis_out/all_job_inspector.md", description="Report output path")
+    model: str = Field("gemini-2.5-flash-lite", description="Gemini model for the brief (e.g. gemini-2.5-pro)")
 
 
 class AllJobsInspectorOutput(BaseModel):
@@ -0,0 +1,73 @@
+import functools
+from typing import Any, Dict, List, Optional
+
+from google.cloud import bigquery
+
+# bq_audit_tool writes this Arrow sidecar next to its CSV; analyze_tool only trusts it while newer than the CSV
+ARROW_SIDECAR_SUFFIX = ".arrow"
+
+
+@functools.lru_cache(maxsize=8)
+def get_bq_client(project: str) -> bigquery.Client:
+    """Return a process-wide BigQuery client for ``project``.
+
+    The client holds a pooled HTTP session and cached credentials, so reusing it avoids a fresh
+    TLS handshake and ADC token refresh on every tool call.
+    """
+    return bigquery.Client(project=project)
+
+
+@functools.lru_cache(maxsize=1)
+def get_bqstorage_client():
+    """Return a shared BigQuery Storage read client, or None when pyarrow/bigquery-storage are missing."""
+    try:
+        import pyarrow  # noqa: F401
+        from google.cloud import bigquery_storage
+        return bigquery_storage.BigQueryReadClient()
+    except Exception:
+        return None
+
+
+def rows_as_dicts(
+    job: bigquery.QueryJob,
+    max_chars: Optional[Dict[str, int]] = None,
+    fill_null: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Materialize a query job's rows as plain dicts.
+
+    Streams Arrow record batches over the Storage Read API when available; otherwise pages the
+    REST row iterator. ``max_chars`` clips the named string columns to at most that many characters
+    and ``fill_null`` replaces NULLs in the named columns, using Arrow compute kernels on the fast path.
+    """
+    bqstorage_client = get_bqstorage_client()
+    if bqstorage_client is not None:
+        try:
+            table = job.result().to_arrow(bqstorage_client=bqstorage_client)
+            if max_chars or fill_null:
+                import pyarrow as pa
+                import pyarrow.compute as pc
+                for name, limit in (max_chars or {}).items():
+                    idx = table.schema.get_field_index(name)
+                    if idx >= 0:
+                        table = table.set_column(idx, name, pc.utf8_slice_codeunits(table.column(name), 0, limit))
+                for name, value in (fill_null or {}).items():
+                    idx = table.schema.get_field_index(name)
+                    if idx >= 0:
+                        col = table.column(name)
+                        if pa.types.is_null(col.type):  # every value NULL: no type to fill into yet
+                            col = col.cast(pa.scalar(value).type)
+                        table = table.set_column(idx, name, pc.fill_null(col, value))
+            return table.to_pylist()
+        except Exception:
+            pass  # e.g. no bigquery.readsessions permission; fall back to REST paging
+    rows = [dict(r.items()) for r in job.result()]
+    if max_chars or fill_null:
+        for r in rows:
+            for name, limit in (max_chars or {}).items():
+                v = r.get(name)
+                if isinstance(v, str) and len(v) > limit:
+                    r[name] = v[:limit]
+            for name, value in (fill_null or {}).items():
+                if r.get(name) is None:
+                    r[name] = value
+    return rows
@@ -0,0 +1,53 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Union
+
+
+class TTLCache:
+    """Thread-safe in-process cache whose entries expire after ``ttl`` seconds.
+
+    At most ``maxsize`` entries are kept, evicting the least recently used; expired entries are
+    dropped whenever a new one is stored. ``ttl`` may be a callable so it can follow an env var.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Union[float, Callable[[], float]],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl if callable(ttl) else (lambda: ttl)
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None:
+                return default
+            if self._clock() - hit[0] >= self._ttl():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return hit[1]
+
+    def set(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        """Store ``value``; ``stored_at`` backdates the entry (e.g. to a file's mtime)."""
+        with self._lock:
+            now = self._clock()
+            self._entries[key] = (now if stored_at is None else stored_at, value)
+            self._entries.move_to_end(key)
+            ttl = self._ttl()
+            for k in [k for k, (t, _) in self._entries.items() if now - t >= ttl]:
+                del self._entries[k]
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def discard_if(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drop every entry whose key matches ``predicate``."""
+        with self._lock:
+            for k in [k for k in self._entries if predicate(k)]:
+                del self._entries[k]
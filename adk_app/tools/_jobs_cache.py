@@ -0,0 +1,130 @@
+"""Short-lived cache for INFORMATION_SCHEMA.JOBS results.
+
+Entries are keyed on ``(kind, project, region, days, limit)`` and kept both in-process and as JSON
+files under ``~/.cache/bq_audit_agent`` (owner-only; expired files are pruned), so repeated tool
+calls over the same window skip the (billed) JOBS scan. ``BQ_JOBS_CACHE_TTL`` sets the lifetime in
+seconds (default 300; 0 disables).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ._cache import TTLCache
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "bq_audit_agent")
+_MAX_ENTRIES = 32
+
+
+def _ttl_seconds() -> float:
+    try:
+        return float(os.environ.get("BQ_JOBS_CACHE_TTL", "300"))
+    except ValueError:
+        return 300.0
+
+
+# Stamped with wall-clock time so entries loaded from disk can carry the file's mtime
+_entries = TTLCache(_MAX_ENTRIES, _ttl_seconds, clock=time.time)
+
+
+def _project_prefix(project: str) -> str:
+    return hashlib.sha256(project.encode("utf-8")).hexdigest()[:12] + "-"
+
+
+def _path_for(key: Tuple) -> str:
+    # Prefixed per project so invalidate() can match files without parsing them; the key is also stored inside
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(CACHE_DIR, f"{_project_prefix(key[1])}{digest}.json")
+
+
+def cached_rows(
+    kind: str,
+    project: str,
+    region: str,
+    days: int,
+    limit: int,
+    fetch: Callable[[], List[Dict[str, Any]]],
+) -> List[Dict[str, Any]]:
+    """Return cached rows for the key, calling ``fetch`` (rows as plain dicts) on a miss."""
+    ttl = _ttl_seconds()
+    if ttl <= 0:
+        return fetch()
+    key = (kind, project, region.upper(), int(days), int(limit))
+    now = time.time()
+
+    hit = _entries.get(key)
+    if hit is not None:
+        return hit
+
+    path = _path_for(key)
+    try:
+        mtime = os.path.getmtime(path)
+        if now - mtime < ttl:
+            with open(path) as f:
+                rows = json.load(f)["rows"]
+            _entries.set(key, rows, stored_at=mtime)
+            return rows
+    except (OSError, ValueError, KeyError):
+        pass
+
+    rows = fetch()
+    _entries.set(key, rows, stored_at=now)
+    try:
+        _store(path, key, rows)
+    except (OSError, TypeError, ValueError):
+        pass
+    _prune(now, ttl)
+    return rows
+
+
+def _store(path: str, key: Tuple, rows: List[Dict[str, Any]]) -> None:
+    # Job SQL text can carry literals/PII: owner-only directory and files, written atomically
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+    os.chmod(CACHE_DIR, 0o700)
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")  # created 0o600
+    try:
+        with os.fdopen(fd, "w") as f:
+            # Timestamps are stored via str(), matching how callers render them
+            json.dump({"key": list(key), "rows": rows}, f, default=str)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _prune(now: float, ttl: float) -> None:
+    """Delete cache files (and stray temp files) older than the TTL."""
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith((".json", ".tmp")):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) >= ttl:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def invalidate(project: Optional[str] = None) -> None:
+    """Drop cached JOBS results for ``project`` (or everything when omitted), in memory and on disk."""
+    _entries.discard_if(lambda k: project is None or k[1] == project)
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    prefix = "" if project is None else _project_prefix(project)
+    for name in names:
+        if name.endswith(".json") and name.startswith(prefix):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                continue
@@ -1,13 +1,18 @@
+import asyncio
 import os
-from typing import List
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, List, Set, Tuple
 
-from google.cloud import bigquery
 from google.adk import Agent
-from google.adk.runners import Runner
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.genai.types import Content, Part
+from google.cloud import bigquery
 
+from .._adk import run_agent_stream
+from .._genai import get_genai_client, stream_generate_content
 from ..schemas import AllJobsInspectorInput, AllJobsInspectorOutput
+from . import _jobs_cache
+from ._bq_clients import get_bq_client, rows_as_dicts
 
 
 PROMPT = (
@@ -21,9 +26,52 @@ PROMPT = (
 )
 
 
-def _fetch_jobs(project: str, region: str, days: int, limit: int) -> List[bigquery.table.Row]:
-    """Return a compact projection of jobs to keep LLM input within token limits."""
-    client = bigquery.Client(project=project)
+_MAX_QUERY_CHARS = 400
+_MAX_VALUE_CHARS = 200
+# Clip long strings at fetch time. One extra char lets _truncate still mark the cut, and queries
+# keep a longer prefix so signatures stay distinct.
+_FETCH_MAX_CHARS = {
+    "query": 4000,
+    "user_email": _MAX_VALUE_CHARS + 1,
+    "statement_type": _MAX_VALUE_CHARS + 1,
+    "top_stages": _MAX_VALUE_CHARS + 1,
+    "last_timeline": _MAX_VALUE_CHARS + 1,
+    "ref_tables": _MAX_VALUE_CHARS + 1,
+}
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+# Rough BPE approximation: word runs split every 4 chars, each punctuation mark its own token
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+_ensured_dirs: Set[str] = set()
+
+
+def _ensure_parent_dir(path: str) -> None:
+    """Create the report's parent directory once per process."""
+    d = os.path.dirname(path)
+    if d and d not in _ensured_dirs:
+        os.makedirs(d, exist_ok=True)
+        _ensured_dirs.add(d)
+
+
+@lru_cache(maxsize=32)
+def _jobs_query_config(days: int, limit: int) -> bigquery.QueryJobConfig:
+    # The SQL text stays identical across calls; only the bound values change
+    return bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("days", "INT64", days),
+            bigquery.ScalarQueryParameter("row_limit", "INT64", limit),
+        ]
+    )
+
+
+def _fetch_jobs(project: str, region: str, days: int, limit: int) -> List[Dict[str, Any]]:
+    """Return a compact projection of jobs to keep LLM input within token limits.
+
+    Results are served from the short-lived JOBS cache when the same window was fetched recently.
+    """
+    client = get_bq_client(project)
     sql = f"""
     SELECT
       j.job_id,
@@ -33,113 +81,185 @@ def _fetch_jobs(project: str, region: str, days: int, limit: int) -> List[bigque
       j.total_slot_ms,
       j.statement_type,
       j.query,
-      -- Compact stage info
-      stage.name AS stage_name,
-      stage.slot_ms AS stage_slot_ms,
-      stage.records_read AS stage_records_read,
-      stage.records_written AS stage_records_written,
-      -- Compact timeline info
-      timeline_entry.elapsed_ms AS t_elapsed_ms,
-      timeline_entry.total_slot_ms AS t_total_slot_ms,
-      timeline_entry.pending_units AS t_pending_units,
-      timeline_entry.completed_units AS t_completed_units,
-      timeline_entry.active_units AS t_active_units,
+      -- Top 3 stages by slot time, pre-formatted (one row per job, no UNNEST fan-out)
+      ARRAY_TO_STRING(ARRAY(
+        SELECT FORMAT('%t(slot_ms=%t, rr=%t, rw=%t)', s.name, s.slot_ms, s.records_read, s.records_written)
+        FROM UNNEST(j.job_stages) AS s
+        ORDER BY s.slot_ms DESC
+        LIMIT 3
+      ), '; ') AS top_stages,
+      -- Final timeline sample only
+      (
+        SELECT FORMAT('elapsed_ms=%t, total_slot_ms=%t, pending=%t, completed=%t, active=%t',
+                      t.elapsed_ms, t.total_slot_ms, t.pending_units, t.completed_units, t.active_units)
+        FROM UNNEST(j.timeline) AS t
+        ORDER BY t.elapsed_ms DESC
+        LIMIT 1
+      ) AS last_timeline,
       -- Referenced table identifiers
-      ref_table.project_id AS ref_project,
-      ref_table.dataset_id AS ref_dataset,
-      ref_table.table_id AS ref_table
+      ARRAY_TO_STRING(ARRAY(
+        SELECT FORMAT('%s.%s.%s', r.project_id, r.dataset_id, r.table_id)
+        FROM UNNEST(j.referenced_tables) AS r
+      ), ', ') AS ref_tables
     FROM `region-{region.lower()}`.INFORMATION_SCHEMA.JOBS AS j
-    LEFT JOIN UNNEST(j.job_stages) AS stage
-    LEFT JOIN UNNEST(j.timeline) AS timeline_entry
-    LEFT JOIN UNNEST(j.referenced_tables) as ref_table
-    WHERE j.creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY)
+    WHERE j.creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @days DAY)
       AND j.job_type = 'QUERY'
     ORDER BY j.creation_time DESC
-    LIMIT {limit}
+    LIMIT @row_limit
+    """
+    return _jobs_cache.cached_rows(
+        "inspector",
+        project,
+        region,
+        days,
+        limit,
+        lambda: rows_as_dicts(
+            client.query(sql, job_config=_jobs_query_config(days, limit), location=region),
+            max_chars=_FETCH_MAX_CHARS,
+        ),
+    )
+
+
+def _truncate(v: Any, limit: int) -> Any:
+    if isinstance(v, str) and len(v) > limit:
+        return v[:limit] + " ..."
+    return v
+
+
+def _truncate_query(v: Any) -> Any:
+    if isinstance(v, str):
+        return _truncate(v.replace("\n", " "), _MAX_QUERY_CHARS)
+    return v
+
+
+def _query_signature(sql: str) -> str:
+    """Normalize a query to its template: lowercased, literals replaced by ``?``, whitespace collapsed."""
+    return _WHITESPACE_RE.sub(" ", _LITERAL_RE.sub("?", sql.lower())).strip()
+
+
+def _estimate_tokens(text: str) -> int:
+    """Approximate the Gemini token count of ``text`` without a count_tokens round-trip."""
+    return len(_TOKEN_RE.findall(text))
+
+
+_WHITELIST = frozenset({
+    "job_id","user_email","creation_time","total_bytes_billed","total_slot_ms","statement_type",
+    "query","top_stages","last_timeline","ref_tables",
+})
+
+
+@lru_cache(maxsize=16)
+def _row_formatter(columns: Tuple[str, ...]) -> Callable[[int, Tuple[Any, ...]], str]:
+    """Compile ``(count, row_values) -> line`` for one column order.
+
+    The whitelist projection, per-column truncation and the `` | `` join are folded into a single
+    ``str.format`` call, so the per-row cost is one function call.
     """
-    return list(client.query(sql, location=region).result())
+    fields = [(i, k) for i, k in enumerate(columns) if k in _WHITELIST]
+    template = " | ".join(["count={}"] + [f"{k}={{}}" for _, k in fields])
+    args = ["n"] + [
+        f"_tq(vals[{i}])" if k == "query" else f"_t(vals[{i}], {_MAX_VALUE_CHARS})" for i, k in fields
+    ]
+    src = f"lambda n, vals: {template!r}.format({', '.join(args)})"
+    return eval(src, {"_t": _truncate, "_tq": _truncate_query})
 
 
-def _rows_to_text(rows: List[bigquery.table.Row]) -> str:
-    """Format rows for LLM input, with strict truncation to avoid token overflow."""
-    whitelist = {
-        "job_id","user_email","creation_time","total_bytes_billed","total_slot_ms","statement_type",
-        "query","stage_name","stage_slot_ms","stage_records_read","stage_records_written",
-        "t_elapsed_ms","t_total_slot_ms","t_pending_units","t_completed_units","t_active_units",
-        "ref_project","ref_dataset","ref_table",
-    }
+def _rows_to_text(rows: List[Dict[str, Any]]) -> str:
+    """Format rows for LLM input, with strict truncation to avoid token overflow.
+
+    Jobs sharing a query signature collapse into one line (the most recent job) prefixed with ``count=N``,
+    ordered by how often the pattern recurs.
+    """
     max_rows = 120  # hard cap
-    max_chars = 250_000  # cap total characters passed to LLM
+    max_tokens = 800_000  # gemini-2.5-flash-lite context window minus headroom
+    if not rows:
+        return ""
+    sigs = [_query_signature(r.get("query") or "") for r in rows]
+    counts = Counter(sigs)
+    representatives: Dict[str, Dict[str, Any]] = {}
+    for sig, r in zip(sigs, rows):
+        representatives.setdefault(sig, r)
+    # Every row shares the query's column order, so one specialized formatter serves them all
+    fmt = _row_formatter(tuple(rows[0].keys()))
     lines: List[str] = []
-    total_len = 0
-    for idx, r in enumerate(rows):
-        if idx >= max_rows:
-            break
-        parts = []
-        for k in r.keys():
-            if k not in whitelist:
-                continue
-            v = r.get(k)
-            if k == "query" and isinstance(v, str):
-                v = v.replace("\n", " ")
-                if len(v) > 400:
-                    v = v[:400] + " ..."
-            elif isinstance(v, str) and len(v) > 200:
-                v = v[:200] + " ..."
-            parts.append(f"{k}={v}")
-        line = " | ".join(parts)
-        if total_len + len(line) > max_chars:
+    total_tokens = 0
+    shown = 0
+    for sig, n in counts.most_common(max_rows):
+        line = fmt(n, tuple(representatives[sig].values()))
+        line_tokens = _estimate_tokens(line)
+        if total_tokens + line_tokens > max_tokens:
             lines.append("... (truncated for length) ...")
             break
         lines.append(line)
-        total_len += len(line)
-    if len(rows) > idx + 1:
-        lines.append(f"... and {len(rows)-(idx+1)} more rows")
+        total_tokens += line_tokens
+        shown += 1
+    if len(counts) > shown:
+        lines.append(f"... and {len(counts) - shown} more query patterns")
     return "\n".join(lines)
 
 
-def all_job_inspector_tool(params: AllJobsInspectorInput) -> AllJobsInspectorOutput:
-    rows = _fetch_jobs(params.project, params.region, params.days, params.limit)
-    jobs_text = _rows_to_text(rows)
-    prompt = PROMPT.replace("{JOBS_TEXT}", jobs_text)
-
-    agent = Agent(
+def _inspector_agent(model: str) -> Agent:
+    return Agent(
         name="all_job_inspector",
-        model="gemini-2.5-flash-lite",
+        model=model,
         instruction="Summarize and optimize job patterns across many jobs.",
         tools=[],
     )
 
+
+async def _run_stream(prompt: str, model: str) -> AsyncIterator[str]:
+    """Yield the inspector agent's text chunks as they are produced."""
+    async for txt in run_agent_stream("all_job_inspector_app", lambda: _inspector_agent(model), prompt, variant=model):
+        yield txt
+
+
+def _build_prompt(params: AllJobsInspectorInput) -> str:
+    rows = _fetch_jobs(params.project, params.region, params.days, params.limit)
+    return PROMPT.replace("{JOBS_TEXT}", _rows_to_text(rows))
+
+
+async def all_job_inspector_tool_stream(params: AllJobsInspectorInput) -> AsyncIterator[str]:
+    """Stream the optimization brief chunk-by-chunk, mirroring it into ``params.output_path`` as it arrives."""
+    prompt = await asyncio.to_thread(_build_prompt, params)
+    _ensure_parent_dir(params.output_path)
+    f = await asyncio.to_thread(open, params.output_path, "w")
+    try:
+        produced = False
+        async for chunk in _run_stream(prompt, params.model):
+            # Buffered write; same "\n" separators as the sync tool's join
+            f.write(("\n" if produced else "") + chunk)
+            produced = True
+            yield chunk
+        if not produced:
+            # Fallback to Google AI API
+            async for chunk in stream_generate_content("gemini-2.0-flash", prompt):
+                f.write(chunk)
+                yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def all_job_inspector_tool(params: AllJobsInspectorInput) -> AllJobsInspectorOutput:
+    prompt = _build_prompt(params)
+
     async def _run() -> str:
-        session_service = InMemorySessionService()
-        app_name = "all_job_inspector_app"
-        user_id = "local_user"
-        session_id = "aji_session"
-        await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        runner = Runner(app_name=app_name, agent=agent, session_service=session_service)
-        msg = Content(role="user", parts=[Part.from_text(text=prompt)])
         chunks: List[str] = []
-        async for ev in runner.run_async(user_id=user_id, session_id=session_id, new_message=msg):
-            txt = getattr(ev, "text", None)
-            if txt:
-                chunks.append(txt)
+        async for chunk in _run_stream(prompt, params.model):
+            chunks.append(chunk)
         return "\n".join(chunks).strip()
 
-    import asyncio
     text = asyncio.run(_run())
     if not text:
         # Fallback to Google AI API
         try:
-            from google.genai import Client  # type: ignore
-            api_key = os.environ.get("GOOGLE_API_KEY") or os.environ.get("GENAI_API_KEY")
-            if api_key:
-                client = Client(api_key=api_key)
+            client = get_genai_client()
+            if client is not None:
                 resp = client.models.generate_content(model="gemini-2.0-flash", contents=prompt)
                 text = (getattr(resp, "text", "") or "").strip()
         except Exception:
             text = text or ""
 
-    os.makedirs(os.path.dirname(params.output_path), exist_ok=True)
+    _ensure_parent_dir(params.output_path)
     with open(params.output_path, "w") as f:
         f.write(text)
     preview = "\n".join(text.splitlines()[:40])
@@ -1,14 +1,15 @@
+import functools
 import os
-from typing import List
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 import datetime as dt
 
 from google.adk import Agent
 from google.adk.code_executors import BuiltInCodeExecutor
-from google.adk.runners import Runner
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.genai.types import Content, Part
 
+from .._adk import run_agent_stream
 from ..schemas import AnalyzeInput, AnalyzeOutput
+from ._bq_clients import ARROW_SIDECAR_SUFFIX
 
 
 ANALYZE_SYSTEM_PROMPT = (
@@ -28,14 +29,335 @@ def _ensure_dir(path: str) -> str:
     return os.path.abspath(path)
 
 
-def analyze_tool(params: AnalyzeInput) -> AnalyzeOutput:
-    csv_path = os.path.abspath(params.csv_path)
-    out_dir = _ensure_dir(params.output_dir)
-    ts = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-    target_pdf = os.path.abspath(os.path.join(out_dir, f"analysis_report_{ts}.pdf"))
+_CHUNK_ROWS = 200_000
+_NUMERIC_COLS = ["total_bytes_billed", "total_bytes_processed", "total_slot_ms"]
+_TEXT_COLS = ["job_id", "user_email", "creation_time", "statement_type"]
+
+
+def _iter_csv_chunks(csv_path: str) -> Iterator[Any]:
+    """Yield the audit CSV as bounded DataFrame chunks holding only the columns the report plots.
+
+    The (large) query text is never read. With pyarrow, a fresh Arrow IPC (Feather v2) sidecar next to
+    the CSV is memory-mapped instead of parsing; otherwise the CSV is streamed and the sidecar written.
+    """
+    import csv
+    import pandas as pd
 
-    # Build an LLM agent with a built-in code executor
-    agent = Agent(
+    with open(csv_path, newline="") as f:
+        header = next(csv.reader(f), [])
+    usecols = [c for c in header if c in _NUMERIC_COLS or c in _TEXT_COLS]
+    if not usecols:
+        return
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.feather as pa_feather
+    except ImportError:
+        pa_csv = None
+    if pa_csv is not None:
+        sidecar = csv_path + ARROW_SIDECAR_SUFFIX
+        try:
+            fresh = os.path.getmtime(sidecar) >= os.path.getmtime(csv_path)
+        except OSError:
+            fresh = False
+        if fresh:
+            try:
+                table = pa_feather.read_table(sidecar, columns=usecols, memory_map=True)
+            except Exception:
+                table = None  # stale schema or torn file: re-parse the CSV below
+            if table is not None:
+                for batch in table.to_batches(max_chunksize=_CHUNK_ROWS):
+                    yield batch.to_pandas()
+                return
+        reader = pa_csv.open_csv(
+            csv_path,
+            read_options=pa_csv.ReadOptions(block_size=32 << 20),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=usecols,
+                # Pin every column to text so a later block cannot disagree with what the first one inferred,
+                # and a stray empty/non-numeric cell cannot fail the parse; numbers are coerced per chunk
+                column_types={c: pa.string() for c in usecols},
+                # Empty cells become nulls (NaN), as pd.read_csv reads them, not "" group keys
+                strings_can_be_null=True,
+            ),
+        )
+        # Mirror the parsed batches into the sidecar so the next run skips CSV parsing
+        tmp = f"{sidecar}.{os.getpid()}.tmp"
+        writer = None
+        try:
+            writer = pa.ipc.new_file(tmp, reader.schema, options=pa.ipc.IpcWriteOptions(compression="lz4"))
+        except Exception:
+            pass
+        try:
+            for batch in reader:
+                if writer is not None:
+                    writer.write_batch(batch)
+                yield batch.to_pandas()
+            if writer is not None:
+                writer.close()
+                writer = None
+                os.replace(tmp, sidecar)
+        finally:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return
+    yield from pd.read_csv(csv_path, usecols=usecols, chunksize=_CHUNK_ROWS)
+
+
+def _aggregate_csv(csv_path: str, gib_per_byte: float, usd_per_byte: float) -> Dict[str, Any]:
+    """Stream the audit CSV chunk by chunk, keeping only the small aggregates the report plots.
+
+    Returns ``daily`` (gib/cost per date), ``by_user`` and ``by_type`` (top 10 GiB), ``top_billed``
+    (job_id/billed_gib/cost_usd), ``top_slot`` (job_id/total_slot_ms/slot_seconds) and ``billed_nonzero_gib``;
+    entries are None when the CSV lacks the needed columns.
+    """
+    import pandas as pd
+
+    columns: List[str] = []
+    daily_parts, user_parts, type_parts = [], [], []
+    top_billed_parts, top_slot_parts, nonzero_parts = [], [], []
+    for df in _iter_csv_chunks(csv_path):
+        columns = list(df.columns)
+        # Numeric fields arrive as text from the Arrow reader (or untyped from pandas when a cell is stray);
+        # coerce them here so empty/non-numeric cells count as 0 instead of failing the report
+        for col in _NUMERIC_COLS:
+            if col in df.columns:
+                if not pd.api.types.is_numeric_dtype(df[col]):
+                    df[col] = pd.to_numeric(df[col], errors="coerce")
+                if df[col].hasnans:
+                    df[col] = df[col].fillna(0)
+        # Parse creation_time
+        if "creation_time" in df.columns:
+            # BigQuery emits ISO-8601 UTC; the explicit format takes the C parser instead of per-value inference
+            df["creation_time"] = pd.to_datetime(
+                df["creation_time"], format="ISO8601", errors="coerce", cache=True, utc=True
+            )
+            # int64-backed day keys (UTC) rather than boxed datetime.date objects; NaT stays NaT
+            df["date"] = df["creation_time"].values.astype("datetime64[D]")
+        if "total_slot_ms" in df.columns and "job_id" in df.columns:
+            top_slot_parts.append(df.nlargest(10, "total_slot_ms")[["job_id", "total_slot_ms"]])
+        if "total_bytes_billed" not in df.columns:
+            continue
+        # Scale once per chunk; every aggregate below reuses these columns
+        df["billed_gib"] = df["total_bytes_billed"] * gib_per_byte
+        df["cost_usd"] = df["total_bytes_billed"] * usd_per_byte
+        nonzero_parts.append(df.loc[df["total_bytes_billed"] > 0, "billed_gib"])
+        if "date" in df.columns:
+            daily_parts.append(df.groupby("date")[["billed_gib", "cost_usd"]].sum())
+        if "user_email" in df.columns:
+            user_parts.append(df.groupby("user_email")["billed_gib"].sum())
+        if "statement_type" in df.columns:
+            type_parts.append(df.groupby("statement_type")["billed_gib"].sum())
+        if "job_id" in df.columns:
+            top_billed_parts.append(df.nlargest(10, "billed_gib")[["job_id", "billed_gib", "cost_usd"]])
+
+    def _top10(parts: List[Any]) -> Any:
+        if not parts:
+            return None
+        return pd.concat(parts).groupby(level=0).sum().nlargest(10)
+
+    has_billed = "total_bytes_billed" in columns
+    top_slot = None
+    if top_slot_parts:
+        # nlargest returns a fresh frame, so the derived column is assigned in place
+        top_slot = pd.concat(top_slot_parts).nlargest(10, "total_slot_ms")
+        top_slot["slot_seconds"] = top_slot["total_slot_ms"] / 1000.0
+    daily = None
+    # ``columns`` is the CSV's own header; the derived ``date`` column comes from creation_time
+    if has_billed and "creation_time" in columns:
+        daily = (
+            pd.concat(daily_parts).groupby(level=0).sum().sort_index()
+            if daily_parts else pd.DataFrame(columns=["billed_gib", "cost_usd"])
+        ).rename(columns={"billed_gib": "gib", "cost_usd": "cost"})
+    return {
+        "daily": daily,
+        "by_user": _top10(user_parts) if has_billed and "user_email" in columns else None,
+        "by_type": _top10(type_parts) if has_billed and "statement_type" in columns else None,
+        "top_billed": pd.concat(top_billed_parts).nlargest(10, "billed_gib") if top_billed_parts else None,
+        "top_slot": top_slot,
+        "billed_nonzero_gib": pd.concat(nonzero_parts) if nonzero_parts else None,
+    }
+
+
+_PALETTE = ["#4C78A8", "#F58518", "#54A24B", "#EECA3B", "#B279A2", "#FF9DA6", "#9C755F", "#BAB0AC"]
+
+
+_RCPARAMS = {
+    "axes.spines.top": False,
+    "axes.spines.right": False,
+    "axes.grid": True,
+    "grid.alpha": 0.2,
+    "axes.titlesize": 14,
+    "axes.labelsize": 12,
+    "xtick.labelsize": 10,
+    "ytick.labelsize": 10,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _apply_style() -> None:
+    """Select the non-interactive backend and the report's sleek, modern styling, once per process."""
+    import matplotlib
+    matplotlib.use("Agg")  # non-interactive backend
+    matplotlib.rcParams.update(_RCPARAMS)
+    import matplotlib.pyplot as plt
+    plt.style.use("seaborn-v0_8")  # parses the stylesheet from disk
+
+
+@contextmanager
+def _page(sink: Callable[[Any], None], figsize: Tuple[float, float]) -> Iterator[Any]:
+    """Yield a fresh Axes; on exit lay the figure out, hand it to ``sink`` (e.g. ``pdf.savefig``) and free it."""
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=figsize)
+    try:
+        yield ax
+        fig.tight_layout()
+        sink(fig)
+    finally:
+        plt.close(fig)
+
+
+# Each plot checks for empty input before touching matplotlib, so missing data costs no figure.
+
+def _plot_top_billed(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 1: Top 10 jobs by billed bytes
+    top10_gib = agg["top_billed"]
+    if top10_gib is None or top10_gib.empty:
+        return
+    with _page(sink, (10, 6)) as ax:
+        bars = ax.barh(top10_gib["job_id"], top10_gib["billed_gib"], color=_PALETTE[0])
+        ax.invert_yaxis()
+        ax.set_title("Top 10 Jobs by Billed Bytes (GiB)")
+        ax.set_xlabel("Billed GiB")
+        # annotate values
+        ax.bar_label(bars, labels=[f"{v:.2f}" for v in top10_gib["billed_gib"]], padding=3)
+
+
+def _plot_top_users(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 2: Top 10 users by total billed bytes
+    by_user_gib = agg["by_user"]
+    if by_user_gib is None or by_user_gib.empty:
+        return
+    with _page(sink, (10, 6)) as ax:
+        bars = ax.barh(by_user_gib.index, by_user_gib.values, color=_PALETTE[1])
+        ax.invert_yaxis()
+        ax.set_title("Top 10 Users by Total Billed (GiB)")
+        ax.set_xlabel("Billed GiB")
+        ax.bar_label(bars, labels=[f"{v:.2f}" for v in by_user_gib.values], padding=3)
+
+
+def _plot_billed_hist(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 3: Distribution of billed bytes for non-zero values
+    billed_nonzero_gib = agg["billed_nonzero_gib"]
+    if billed_nonzero_gib is None or billed_nonzero_gib.empty:
+        return
+    with _page(sink, (10, 6)) as ax:
+        ax.hist(billed_nonzero_gib, bins=30, color=_PALETTE[2], edgecolor="white")
+        ax.set_title("Distribution of Billed (GiB)")
+        ax.set_xlabel("Billed GiB")
+        ax.set_ylabel("Count")
+
+
+def _plot_daily_billed(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 4: Daily total billed bytes trend
+    daily = agg["daily"]
+    if daily is None or daily.empty:
+        return
+    with _page(sink, (11, 5)) as ax:
+        ax.plot(daily.index, daily["gib"].values, marker="o", linewidth=2, color=_PALETTE[3])
+        ax.set_title("Daily Total Billed (GiB)")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Billed GiB")
+        ax.tick_params(axis="x", labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment("right")
+
+
+def _plot_by_type(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 5: Breakdown by statement_type (top categories)
+    by_type_gib = agg["by_type"]
+    if by_type_gib is None or by_type_gib.empty:
+        return
+    with _page(sink, (10, 6)) as ax:
+        ax.barh(by_type_gib.index.astype(str), by_type_gib.values, color=_PALETTE[4])
+        ax.invert_yaxis()
+        ax.set_title("Top Statement Types by Total Billed (GiB)")
+        ax.set_xlabel("Billed GiB")
+
+
+def _plot_top_slot(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 6: Top 10 jobs by total slot time (seconds)
+    top_slot_sec = agg["top_slot"]
+    if top_slot_sec is None or top_slot_sec.empty:
+        return
+    with _page(sink, (10, 6)) as ax:
+        bars = ax.barh(top_slot_sec["job_id"], top_slot_sec["slot_seconds"], color=_PALETTE[5])
+        ax.invert_yaxis()
+        ax.set_title("Top 10 Jobs by Slot Time")
+        ax.set_xlabel("Slot Time (seconds)")
+        ax.bar_label(bars, labels=[f"{v:.1f}" for v in top_slot_sec["slot_seconds"]], padding=3)
+
+
+def _plot_top_cost(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 7: Top 10 jobs by estimated on-demand cost (USD)
+    # Cost is billed bytes times a constant, so the billed top 10 is the cost top 10
+    top_cost = agg["top_billed"]
+    if top_cost is None or top_cost.empty:
+        return
+    with _page(sink, (10, 6)) as ax:
+        bars = ax.barh(top_cost["job_id"], top_cost["cost_usd"], color=_PALETTE[6])
+        ax.invert_yaxis()
+        ax.set_title(f"Top 10 Jobs by Estimated Cost (USD) @ ${price}/TiB")
+        ax.set_xlabel("Estimated Cost (USD)")
+        ax.bar_label(bars, labels=[f"${v:.2f}" for v in top_cost["cost_usd"]], padding=3)
+
+
+def _plot_daily_cost(agg: Dict[str, Any], price: float, sink: Callable[[Any], None]) -> None:
+    # Plot 8: Daily total estimated cost (USD)
+    daily = agg["daily"]
+    if daily is None or daily.empty:
+        return
+    with _page(sink, (11, 5)) as ax:
+        ax.plot(daily.index, daily["cost"].values, marker="o", linewidth=2, color=_PALETTE[7])
+        ax.set_title(f"Daily Estimated Cost (USD) @ ${price}/TiB")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Estimated Cost (USD)")
+        ax.tick_params(axis="x", labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment("right")
+
+
+_PLOTS = [
+    _plot_top_billed,
+    _plot_top_users,
+    _plot_billed_hist,
+    _plot_daily_billed,
+    _plot_by_type,
+    _plot_top_slot,
+    _plot_top_cost,
+    _plot_daily_cost,
+]
+
+
+def _write_report(target_pdf: str, agg: Dict[str, Any], price: float) -> None:
+    """Render every plot into ``target_pdf``.
+
+    Pages render serially in this process: eight small figures cost less than starting worker
+    processes, and forking a process that already runs gRPC/ADK threads risks deadlocks.
+    """
+    from matplotlib.backends.backend_pdf import PdfPages
+    _apply_style()
+    with PdfPages(target_pdf) as pdf:
+        for plot in _PLOTS:
+            plot(agg, price, pdf.savefig)
+
+
+def _analysis_agent() -> Agent:
+    # LLM agent with a built-in code executor
+    return Agent(
         name="csv_analysis_agent",
         model="gemini-2.5-flash-lite",
         instruction=ANALYZE_SYSTEM_PROMPT,
@@ -44,11 +366,12 @@ def analyze_tool(params: AnalyzeInput) -> AnalyzeOutput:
         tools=[],
     )
 
-    # Create a session and run instructions asking to analyze the CSV and save a PDF report into out_dir
-    session_service = InMemorySessionService()
-    app_name = "csv_analysis_app"
-    user_id = "local_user"
-    session_id = "analysis_session"
+
+def analyze_tool(params: AnalyzeInput) -> AnalyzeOutput:
+    csv_path = os.path.abspath(params.csv_path)
+    out_dir = _ensure_dir(params.output_dir)
+    ts = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+    target_pdf = os.path.abspath(os.path.join(out_dir, f"analysis_report_{ts}.pdf"))
 
     # Prepare a directive to ensure code saves figures into a timestamped PDF
     task = (
@@ -57,13 +380,9 @@ def analyze_tool(params: AnalyzeInput) -> AnalyzeOutput:
         f"Do not call plt.show(); ensure the PDF file is written to disk."
     )
 
-    # Runner requires an existing session
     async def _run() -> List[str]:
-        await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        runner = Runner(app_name=app_name, agent=agent, session_service=session_service)
-        msg = Content(role="user", parts=[Part.from_text(text=params.instructions + "\n\n" + task)])
-        # Stream events; we don't need the text, just let the agent execute code
-        async for _ in runner.run_async(user_id=user_id, session_id=session_id, new_message=msg):
+        # Stream events on the shared runner; we don't need the text, just let the agent execute code
+        async for _ in run_agent_stream("csv_analysis_app", _analysis_agent, params.instructions + "\n\n" + task):
             pass
         # After run completes, prefer the intended timestamped PDF if present
         pdfs: List[str] = []
@@ -84,22 +403,6 @@ def analyze_tool(params: AnalyzeInput) -> AnalyzeOutput:
     if not os.path.exists(target_pdf):
         plots = []
         try:
-            import pandas as pd
-            import matplotlib
-            matplotlib.use("Agg")  # non-interactive backend
-            import matplotlib.pyplot as plt
-            from matplotlib.backends.backend_pdf import PdfPages
-
-            df = pd.read_csv(csv_path)
-            # Coerce numeric fields
-            for col in ["total_bytes_billed", "total_bytes_processed", "total_slot_ms"]:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-            # Parse creation_time
-            if "creation_time" in df.columns:
-                with pd.option_context('mode.chained_assignment', None):
-                    df["creation_time"] = pd.to_datetime(df["creation_time"], errors="coerce")
-                    df["date"] = df["creation_time"].dt.date
             BYTES_PER_GIB = 1024 ** 3
             BYTES_PER_TIB = 1024 ** 4
             # Allow override of price per TiB via env; default $5/TiB for on-demand
@@ -107,157 +410,11 @@ def analyze_tool(params: AnalyzeInput) -> AnalyzeOutput:
                 PRICE_PER_TIB_USD = float(os.environ.get("BQ_ONDEMAND_PRICE_PER_TIB_USD", "5.0"))
             except Exception:
                 PRICE_PER_TIB_USD = 5.0
-            # Apply sleek, modern styling
-            import matplotlib as mpl
-            mpl.rcParams.update({
-                "axes.spines.top": False,
-                "axes.spines.right": False,
-                "axes.grid": True,
-                "grid.alpha": 0.2,
-                "axes.titlesize": 14,
-                "axes.labelsize": 12,
-                "xtick.labelsize": 10,
-                "ytick.labelsize": 10,
-            })
-            import matplotlib.pyplot as plt
-            plt.style.use("seaborn-v0_8")
-            palette = ["#4C78A8", "#F58518", "#54A24B", "#EECA3B", "#B279A2", "#FF9DA6", "#9C755F", "#BAB0AC"]
-
-            pdf_path = target_pdf
-            with PdfPages(pdf_path) as pdf:
-                # Plot 1: Top 10 jobs by billed bytes
-                if {"job_id", "total_bytes_billed"}.issubset(df.columns):
-                    top10 = (
-                        df[["job_id", "total_bytes_billed"]]
-                        .sort_values("total_bytes_billed", ascending=False)
-                        .head(10)
-                    )
-                    top10_gib = top10.copy()
-                    top10_gib["total_gib"] = top10_gib["total_bytes_billed"] / BYTES_PER_GIB
-                    plt.figure(figsize=(10, 6))
-                    bars = plt.barh(top10_gib["job_id"], top10_gib["total_gib"], color=palette[0]) 
-                    plt.gca().invert_yaxis()
-                    plt.title("Top 10 Jobs by Billed Bytes (GiB)")
-                    plt.xlabel("Billed GiB")
-                    # annotate values
-                    mx = max(top10_gib["total_gib"]) if len(top10_gib) else 0
-                    for b in bars:
-                        w = b.get_width()
-                        plt.text(w + mx * 0.01, b.get_y() + b.get_height()/2, f"{w:.2f}", va="center")
-                    plt.tight_layout()
-                    pdf.savefig()
-                    plt.close()
-
-                # Plot 2: Top 10 users by total billed bytes
-                if {"user_email", "total_bytes_billed"}.issubset(df.columns):
-                    by_user_bytes = df.groupby("user_email")["total_bytes_billed"].sum().sort_values(ascending=False).head(10)
-                    by_user_gib = by_user_bytes / BYTES_PER_GIB
-                    plt.figure(figsize=(10, 6))
-                    bars = plt.barh(by_user_gib.index, by_user_gib.values, color=palette[1])
-                    plt.gca().invert_yaxis()
-                    plt.title("Top 10 Users by Total Billed (GiB)")
-                    plt.xlabel("Billed GiB")
-                    mx = max(by_user_gib.values) if len(by_user_gib.values) else 0
-                    for b, v in zip(bars, by_user_gib.values):
-                        plt.text(v + mx * 0.01, b.get_y() + b.get_height()/2, f"{v:.2f}", va="center")
-                    plt.tight_layout()
-                    pdf.savefig()
-                    plt.close()
-
-                # Plot 3: Distribution of billed bytes (log scale) for non-zero values
-                if "total_bytes_billed" in df.columns:
-                    billed_nonzero_gib = (df.loc[df["total_bytes_billed"] > 0, "total_bytes_billed"]) / BYTES_PER_GIB
-                    if len(billed_nonzero_gib) > 0:
-                        plt.figure(figsize=(10, 6))
-                        plt.hist(billed_nonzero_gib, bins=30, color=palette[2], edgecolor="white")
-                        plt.title("Distribution of Billed (GiB)")
-                        plt.xlabel("Billed GiB")
-                        plt.ylabel("Count")
-                        plt.tight_layout()
-                        pdf.savefig()
-                        plt.close()
-
-                # Plot 4: Daily total billed bytes trend
-                if "date" in df.columns and "total_bytes_billed" in df.columns:
-                    daily_gib = (df.groupby("date")["total_bytes_billed"].sum().sort_index()) / BYTES_PER_GIB
-                    if len(daily_gib) > 0:
-                        plt.figure(figsize=(11, 5))
-                        plt.plot(daily_gib.index, daily_gib.values, marker="o", linewidth=2, color=palette[3])
-                        plt.title("Daily Total Billed (GiB)")
-                        plt.xlabel("Date")
-                        plt.ylabel("Billed GiB")
-                        plt.xticks(rotation=45, ha="right")
-                        plt.tight_layout()
-                        pdf.savefig()
-                        plt.close()
-
-                # Plot 5: Breakdown by statement_type (top categories)
-                if {"statement_type", "total_bytes_billed"}.issubset(df.columns):
-                    by_type_gib = (df.groupby("statement_type")["total_bytes_billed"].sum().sort_values(ascending=False).head(10)) / BYTES_PER_GIB
-                    if len(by_type_gib) > 0:
-                        plt.figure(figsize=(10, 6))
-                        plt.barh(by_type_gib.index.astype(str), by_type_gib.values, color=palette[4])
-                        plt.gca().invert_yaxis()
-                        plt.title("Top Statement Types by Total Billed (GiB)")
-                        plt.xlabel("Billed GiB")
-                        plt.tight_layout()
-                        pdf.savefig()
-                        plt.close()
-
-                # Plot 6: Top 10 jobs by total slot time (seconds)
-                if {"job_id", "total_slot_ms"}.issubset(df.columns):
-                    top_slot = (
-                        df[["job_id", "total_slot_ms"]]
-                        .sort_values("total_slot_ms", ascending=False)
-                        .head(10)
-                    )
-                    top_slot_sec = top_slot.copy()
-                    top_slot_sec["slot_seconds"] = top_slot_sec["total_slot_ms"] / 1000.0
-                    plt.figure(figsize=(10, 6))
-                    bars = plt.barh(top_slot_sec["job_id"], top_slot_sec["slot_seconds"], color=palette[5])
-                    plt.gca().invert_yaxis()
-                    plt.title("Top 10 Jobs by Slot Time")
-                    plt.xlabel("Slot Time (seconds)")
-                    mx = max(top_slot_sec["slot_seconds"]) if len(top_slot_sec) else 0
-                    for b, v in zip(bars, top_slot_sec["slot_seconds"].values):
-                        plt.text(v + mx * 0.01, b.get_y() + b.get_height()/2, f"{v:.1f}", va="center")
-                    plt.tight_layout()
-                    pdf.savefig()
-                    plt.close()
-
-                # Plot 7: Top 10 jobs by estimated on-demand cost (USD)
-                if {"job_id", "total_bytes_billed"}.issubset(df.columns):
-                    cost_df = df[["job_id", "total_bytes_billed"]].copy()
-                    cost_df["cost_usd"] = (cost_df["total_bytes_billed"] / BYTES_PER_TIB) * PRICE_PER_TIB_USD
-                    top_cost = cost_df.sort_values("cost_usd", ascending=False).head(10)
-                    plt.figure(figsize=(10, 6))
-                    bars = plt.barh(top_cost["job_id"], top_cost["cost_usd"], color=palette[6])
-                    plt.gca().invert_yaxis()
-                    plt.title(f"Top 10 Jobs by Estimated Cost (USD) @ ${PRICE_PER_TIB_USD}/TiB")
-                    plt.xlabel("Estimated Cost (USD)")
-                    mx = max(top_cost["cost_usd"]) if len(top_cost) else 0
-                    for b, v in zip(bars, top_cost["cost_usd"].values):
-                        plt.text(v + mx * 0.01, b.get_y() + b.get_height()/2, f"${v:.2f}", va="center")
-                    plt.tight_layout()
-                    pdf.savefig()
-                    plt.close()
-
-                # Plot 8: Daily total estimated cost (USD)
-                if "date" in df.columns and "total_bytes_billed" in df.columns:
-                    daily_cost = (df.groupby("date")["total_bytes_billed"].sum() / BYTES_PER_TIB) * PRICE_PER_TIB_USD
-                    daily_cost = daily_cost.sort_index()
-                    if len(daily_cost) > 0:
-                        plt.figure(figsize=(11, 5))
-                        plt.plot(daily_cost.index, daily_cost.values, marker="o", linewidth=2, color=palette[7])
-                        plt.title(f"Daily Estimated Cost (USD) @ ${PRICE_PER_TIB_USD}/TiB")
-                        plt.xlabel("Date")
-                        plt.ylabel("Estimated Cost (USD)")
-                        plt.xticks(rotation=45, ha="right")
-                        plt.tight_layout()
-                        pdf.savefig()
-                        plt.close()
-
-            plots.append(pdf_path)
+            agg = _aggregate_csv(csv_path, 1.0 / BYTES_PER_GIB, PRICE_PER_TIB_USD / BYTES_PER_TIB)
+            _write_report(target_pdf, agg, PRICE_PER_TIB_USD)
+            # A header-only CSV yields no pages, and PdfPages then writes no file
+            if os.path.exists(target_pdf):
+                plots.append(target_pdf)
         except Exception:
             # If fallback fails, return what we have (likely empty)
             pass
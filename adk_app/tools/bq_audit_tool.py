@@ -1,102 +1,143 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List
 from google.cloud import bigquery
 from ..schemas import AuditInput, AuditOutput, JobStat
+from . import _jobs_cache
+from ._bq_clients import ARROW_SIDECAR_SUFFIX, get_bq_client, rows_as_dicts
 
 
 US_REGIONAL_INFO_SCHEMA = "`region-us`.INFORMATION_SCHEMA.JOBS_BY_PROJECT"
 EU_REGIONAL_INFO_SCHEMA = "`region-eu`.INFORMATION_SCHEMA.JOBS_BY_PROJECT"
 
 
+_SCHEMAS = {"US": US_REGIONAL_INFO_SCHEMA, "EU": EU_REGIONAL_INFO_SCHEMA}
+
+
 def _pick_schema_for_location(location: str) -> str:
-    loc = location.upper()
-    if loc == "US":
-        return US_REGIONAL_INFO_SCHEMA
-    if loc == "EU":
-        return EU_REGIONAL_INFO_SCHEMA
-    raise ValueError(f"Unsupported location '{location}'. Use US or EU.")
+    schema = _SCHEMAS.get(location.upper())
+    if schema is None:
+        raise ValueError(f"Unsupported location '{location}'. Use {' or '.join(_SCHEMAS)}.")
+    return schema
+
 
+_TS_FORMAT = "%Y-%m-%d %H:%M:%E6S+00:00"
 
-def _jobs_query_sql(days: int, limit: int, schema: str) -> str:
+
+def _jobs_query_sql(schema: str) -> str:
     return (
-        "SELECT job_id, user_email, creation_time, end_time, total_bytes_processed, "
-        "total_bytes_billed, total_slot_ms, statement_type, query "
+        "SELECT job_id, user_email, "
+        # Rendered server-side in str(datetime) form so rows need no per-field Python coercion
+        f"IFNULL(FORMAT_TIMESTAMP({_TS_FORMAT!r}, creation_time, 'UTC'), '') AS creation_time, "
+        f"IFNULL(FORMAT_TIMESTAMP({_TS_FORMAT!r}, end_time, 'UTC'), '') AS end_time, "
+        "total_bytes_processed, total_bytes_billed, total_slot_ms, statement_type, "
+        # Long scripts can be many KB; the prefix is enough for every consumer of the CSV
+        "SUBSTR(query, 1, 4000) AS query "
         f"FROM {schema} "
         "WHERE job_type = \"QUERY\" "
-        f"AND creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY) "
-        f"ORDER BY creation_time DESC LIMIT {limit}"
+        "AND creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @days DAY) "
+        "ORDER BY creation_time DESC LIMIT @lim"
+    )
+
+
+@lru_cache(maxsize=32)
+def _jobs_query_config(days: int, limit: int) -> bigquery.QueryJobConfig:
+    # The SQL text stays identical per location; only the bound values change
+    return bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("days", "INT64", days),
+            bigquery.ScalarQueryParameter("lim", "INT64", limit),
+        ]
     )
 
 
+_NULL_DEFAULTS = {"user_email": "", "total_bytes_processed": 0, "total_bytes_billed": 0, "total_slot_ms": 0}
+
+
 def _fetch_jobs(client: bigquery.Client, location: str, days: int, limit: int) -> List[JobStat]:
     schema = _pick_schema_for_location(location)
-    sql = _jobs_query_sql(days=days, limit=limit, schema=schema)
-    job = client.query(sql, location=location)
-    rows = list(job.result())
-    stats: List[JobStat] = []
-    for r in rows:
-        stats.append(
-            JobStat(
-                location=location,
-                job_id=str(r["job_id"]),
-                user_email=str(r["user_email"]) if r["user_email"] is not None else "",
-                creation_time=str(r["creation_time"]) if r["creation_time"] is not None else "",
-                end_time=str(r["end_time"]) if r["end_time"] is not None else "",
-                total_bytes_processed=int(r["total_bytes_processed"]) if r["total_bytes_processed"] is not None else 0,
-                total_bytes_billed=int(r["total_bytes_billed"]) if r["total_bytes_billed"] is not None else 0,
-                total_slot_ms=int(r["total_slot_ms"]) if r["total_slot_ms"] is not None else 0,
-                statement_type=str(r["statement_type"]) if r["statement_type"] is not None else None,
-                query=str(r["query"]) if r["query"] is not None else None,
-            )
-        )
-    return stats
+    sql = _jobs_query_sql(schema)
+    rows = _jobs_cache.cached_rows(
+        "audit",
+        client.project,
+        location,
+        days,
+        limit,
+        lambda: rows_as_dicts(
+            client.query(sql, job_config=_jobs_query_config(days, limit), location=location),
+            fill_null=_NULL_DEFAULTS,
+        ),
+    )
+    # NULLs were filled and timestamps formatted at fetch time, so rows map straight onto JobStat
+    return [JobStat.model_construct(location=location, **r) for r in rows]
+
+
+_CSV_FIELDS = [
+    "location",
+    "job_id",
+    "user_email",
+    "creation_time",
+    "end_time",
+    "total_bytes_processed",
+    "total_bytes_billed",
+    "total_slot_ms",
+    "statement_type",
+    "query",
+]
+
+
+def _write_csv(path: str, jobs: List[JobStat]) -> None:
+    """Write ``jobs`` as CSV in one bulk call via pyarrow's C++ writer, falling back to the csv module.
+
+    With pyarrow, an Arrow IPC sidecar (``<path>.arrow``) is written alongside for analyze_tool.
+    """
+    columns = {f: [getattr(j, f) for j in jobs] for f in _CSV_FIELDS}
+    columns["statement_type"] = [v or "" for v in columns["statement_type"]]
+    columns["query"] = [v or "" for v in columns["query"]]
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.feather as pa_feather
+        table = pa.Table.from_pydict(columns)
+        pa_csv.write_csv(table, path, write_options=pa_csv.WriteOptions(quoting_style="needed"))
+        # Written after the CSV so it is newer; analyze_tool memory-maps it instead of re-parsing
+        try:
+            pa_feather.write_feather(table, path + ARROW_SIDECAR_SUFFIX, compression="lz4")
+        except Exception:
+            pass
+        return
+    except ImportError:
+        pass
+    import csv
+    with open(path, "w", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(_CSV_FIELDS)
+        writer.writerows(zip(*(columns[f] for f in _CSV_FIELDS)))
 
 
 def _top_n_most_expensive(jobs: List[JobStat], n: int) -> List[JobStat]:
-    return sorted(jobs, key=lambda j: (j.total_bytes_billed, j.total_slot_ms), reverse=True)[:n]
+    return heapq.nlargest(n, jobs, key=lambda j: (j.total_bytes_billed, j.total_slot_ms))
 
 
 def bq_audit_tool(params: AuditInput) -> AuditOutput:
-    client = bigquery.Client(project=params.project)
+    client = get_bq_client(params.project)
     all_jobs: List[JobStat] = []
-    for loc in params.locations:
-        try:
-            all_jobs.extend(_fetch_jobs(client, loc, params.days, params.limit))
-        except Exception as exc:
-            # Swallow per-location failures but continue others
-            print(f"Warning: failed fetching jobs from {loc}: {exc}")
-
-    # Write CSV
-    import csv, os
-    fieldnames = [
-        "location",
-        "job_id",
-        "user_email",
-        "creation_time",
-        "end_time",
-        "total_bytes_processed",
-        "total_bytes_billed",
-        "total_slot_ms",
-        "statement_type",
-        "query",
-    ]
-    with open(params.outfile, "w", newline="") as fp:
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        for j in all_jobs:
-            writer.writerow(
-                {
-                    "location": j.location,
-                    "job_id": j.job_id,
-                    "user_email": j.user_email,
-                    "creation_time": j.creation_time,
-                    "end_time": j.end_time,
-                    "total_bytes_processed": j.total_bytes_processed,
-                    "total_bytes_billed": j.total_bytes_billed,
-                    "total_slot_ms": j.total_slot_ms,
-                    "statement_type": j.statement_type or "",
-                    "query": j.query or "",
-                }
-            )
+    # Each location is an independent network round trip; the client is safe to share across threads
+    with ThreadPoolExecutor(max_workers=max(1, len(params.locations))) as ex:
+        futures = [
+            (loc, ex.submit(_fetch_jobs, client, loc, params.days, params.limit)) for loc in params.locations
+        ]
+        # Collect in submission order so the CSV keeps the requested location order
+        for loc, fut in futures:
+            try:
+                all_jobs.extend(fut.result())
+            except Exception as exc:
+                # Swallow per-location failures but continue others
+                print(f"Warning: failed fetching jobs from {loc}: {exc}")
+
+    _write_csv(params.outfile, all_jobs)
 
     top = _top_n_most_expensive(all_jobs, params.topn)
     return AuditOutput(csv_path=os.path.abspath(params.outfile), jobs=all_jobs, top=top)
@@ -1,11 +1,12 @@
+import asyncio
 import os
-from typing import List
+from pathlib import Path
+from typing import List, Optional
 
 from google.adk import Agent
-from google.adk.runners import Runner
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.genai.types import Content, Part
 
+from .._adk import run_agent_stream
+from .._genai import get_genai_aio_client
 from ..schemas import ForensicInput, ForensicOutput
 
 
@@ -56,90 +57,135 @@ PROMPT_TEMPLATE = (
 )
 
 
-def forensic_agent_tool(params: ForensicInput) -> ForensicOutput:
+def _forensic_agent() -> Agent:
+    return Agent(
+        name="forensic_bq_finops",
+        model="gemini-2.5-flash-lite",
+        instruction="Generate the requested forensic report strictly following the user's template.",
+        tools=[],
+    )
+
+
+def _top_sql_from_csv(csv_path: str) -> str:
+    """Return the most expensive non-empty query in the audit CSV ("" when unavailable)."""
+    if not os.path.exists(csv_path):
+        return ""
+    try:
+        import pyarrow.compute as pc
+        import pyarrow.csv as pa_csv
+        tbl = pa_csv.read_csv(
+            csv_path,
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(include_columns=["query", "total_bytes_billed", "total_slot_ms"]),
+        )
+        tbl = tbl.filter(pc.greater(pc.utf8_length(pc.fill_null(tbl["query"], "")), 0))
+        if tbl.num_rows == 0:
+            return ""
+        idx = pc.sort_indices(
+            tbl, sort_keys=[("total_bytes_billed", "descending"), ("total_slot_ms", "descending")]
+        )[0].as_py()
+        return tbl["query"][idx].as_py()
+    except ImportError:
+        pass
+    except Exception:
+        return ""
+    # One streaming pass for the max instead of materializing and sorting every row
+    try:
+        import csv
+        with open(csv_path) as f:
+            best = max(
+                (r for r in csv.DictReader(f) if r.get('query')),
+                key=lambda r: (int(r.get('total_bytes_billed') or 0), int(r.get('total_slot_ms') or 0)),
+                default=None,
+            )
+        return best['query'] if best else ""
+    except Exception:
+        return ""
+
+
+def _build_prompt(params: ForensicInput) -> Optional[str]:
+    """Assemble the forensic prompt, or None when the schema report is missing."""
     md_path = os.path.abspath(params.md_path)
     if not os.path.exists(md_path):
-        return ForensicOutput(report_path="", text_preview="schema_report.md not found")
+        return None
 
     with open(md_path, "r") as f:
         md_text = f.read()
 
-    # Attempt to fetch the top expensive SQL from CSV if present
-    sql_block = ""
-    try:
-        import csv
-        csv_path = os.path.abspath("./bq_job_stats_today.csv")
-        if os.path.exists(csv_path):
-            with open(csv_path) as f:
-                rows = list(csv.DictReader(f))
-            rows.sort(key=lambda r: (int(r.get('total_bytes_billed') or 0), int(r.get('total_slot_ms') or 0)), reverse=True)
-            for r in rows:
-                if r.get('query'):
-                    sql_block = r['query']
-                    break
-    except Exception:
-        pass
+    sql_block = params.top_sql or _top_sql_from_csv(os.path.abspath("./bq_job_stats_today.csv"))
 
     # Extract a lightweight schema block from the markdown (columns_detailed section if available)
-    schema_block = ""
-    try:
-        lines = md_text.splitlines()
-        start = None
-        for i, ln in enumerate(lines):
-            if ln.strip().lower().startswith('columns_detailed'):
-                start = i
-                break
-        if start is not None:
-            schema_block = "\n".join(lines[start:start+50])
-        else:
-            schema_block = md_text[:800]
-    except Exception:
-        schema_block = md_text[:800]
+    i = md_text.lower().find("columns_detailed")
+    schema_block = md_text[i:i + 4000] if i >= 0 else md_text[:800]
 
-    prompt = PROMPT_TEMPLATE.replace("{SQL_BLOCK}", sql_block or "[SQL not found]") \
-                             .replace("{SCHEMA_BLOCK}", schema_block or "[Schema not found]") \
-                             .replace("{FULL_MD}", md_text)
+    return PROMPT_TEMPLATE.replace("{SQL_BLOCK}", sql_block or "[SQL not found]") \
+                          .replace("{SCHEMA_BLOCK}", schema_block or "[Schema not found]") \
+                          .replace("{FULL_MD}", md_text)
 
-    # ADK-first: use an LLM agent, fallback to Google AI API only if no text
-    agent = Agent(
-        name="forensic_bq_finops",
-        model="gemini-2.5-flash-lite",
-        instruction="Generate the requested forensic report strictly following the user's template.",
-        tools=[],
-    )
 
-    async def _run() -> str:
-        session_service = InMemorySessionService()
-        app_name = "forensic_app"
-        user_id = "local_user"
-        session_id = "forensic_session"
-        await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        runner = Runner(app_name=app_name, agent=agent, session_service=session_service)
-        msg = Content(role="user", parts=[Part.from_text(text=prompt)])
-        chunks: List[str] = []
-        async for ev in runner.run_async(user_id=user_id, session_id=session_id, new_message=msg):
-            txt = getattr(ev, "text", None)
-            if txt:
-                chunks.append(txt)
-        return "\n".join(chunks).strip()
-
-    import asyncio
-    text = asyncio.run(_run())
+async def _generate(prompt: str) -> str:
+    # ADK-first: use an LLM agent, fallback to Google AI API only if no text
+    chunks: List[str] = []
+    async for txt in run_agent_stream("forensic_app", _forensic_agent, prompt):
+        chunks.append(txt)
+    text = "\n".join(chunks).strip()
     if not text:
         try:
-            from google.genai import Client  # type: ignore
-            import os as _os
-            api_key = _os.environ.get("GOOGLE_API_KEY") or _os.environ.get("GENAI_API_KEY")
-            if api_key:
-                client = Client(api_key=api_key)
-                resp = client.models.generate_content(model="gemini-2.0-flash", contents=prompt)
+            client = get_genai_aio_client()
+            if client is not None:
+                resp = await client.models.generate_content(model="gemini-2.0-flash", contents=prompt)
                 text = (getattr(resp, "text", "") or "").strip()
         except Exception:
             text = text or ""
-    os.makedirs(os.path.dirname(params.output_path), exist_ok=True)
-    with open(params.output_path, "w") as f:
-        f.write(text)
-    preview = "\n".join(text.splitlines()[:40])
-    return ForensicOutput(report_path=os.path.abspath(params.output_path), text_preview=preview)
+    return text
+
+
+def _save_report(params: ForensicInput, text: str) -> ForensicOutput:
+    if not text:
+        # Nothing generated: leave no empty report behind
+        return ForensicOutput(report_path="", text_preview="(empty)")
+    out = Path(params.output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(text, encoding="utf-8")
+    preview = "\n".join(text.split("\n", 40)[:40])
+    return ForensicOutput(report_path=str(out.resolve()), text_preview=preview)
+
+
+def _missing_md() -> ForensicOutput:
+    return ForensicOutput(report_path="", text_preview="schema_report.md not found")
+
+
+def forensic_agent_tool(params: ForensicInput) -> ForensicOutput:
+    prompt = _build_prompt(params)
+    if prompt is None:
+        return _missing_md()
+    text = asyncio.run(_generate(prompt))
+    return _save_report(params, text)
+
+
+def _max_concurrency() -> int:
+    try:
+        return max(1, int(os.environ.get("FORENSIC_MAX_CONCURRENCY", "4")))
+    except ValueError:
+        return 4
+
+
+def forensic_agent_tool_batch(params_list: List[ForensicInput]) -> List[ForensicOutput]:
+    """Run several forensic reports on one event loop, at most ``FORENSIC_MAX_CONCURRENCY`` (default 4) at a time.
+
+    Results are returned in input order; each request gets its own session on the shared runner.
+    """
+    async def _run_all() -> List[Optional[str]]:
+        sem = asyncio.Semaphore(_max_concurrency())
+
+        async def _one(prompt: Optional[str]) -> Optional[str]:
+            if prompt is None:
+                return None
+            async with sem:
+                return await _generate(prompt)
 
+        prompts = await asyncio.gather(*[asyncio.to_thread(_build_prompt, p) for p in params_list])
+        return await asyncio.gather(*[_one(p) for p in prompts])
 
+    texts = asyncio.run(_run_all())
+    return [_missing_md() if text is None else _save_report(p, text) for p, text in zip(params_list, texts)]
@@ -1,29 +1,67 @@
-import json
-import re
+import asyncio
+import bisect
 import os
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import datetime
 
 from google.adk import Agent
-from google.adk.runners import Runner
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.genai.types import Content, Part
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 
+from .._adk import run_agent_stream
 from ..schemas import QueryAnalysisInput, QueryAnalysisOutput, ExtractedTable
+from ._bq_clients import get_bq_client, rows_as_dicts
+from ._cache import TTLCache
+
+try:  # Linear-time DFA matching when google-re2 is installed
+    import re2 as _re  # type: ignore
+except ImportError:
+    import re as _re
+
+try:  # Faster JSON parsing of the extractor's output
+    from orjson import loads as _json_loads  # type: ignore
+except ImportError:
+    from json import loads as _json_loads
+
+try:  # Real BigQuery parser for table extraction; the regexes below remain the fallback
+    import sqlglot  # type: ignore
+    from sqlglot import exp as _sqlglot_exp  # type: ignore
+except ImportError:
+    sqlglot = None
+
+
+@lru_cache(maxsize=512)
+def _get_dataset(client: bigquery.Client, project: str, dataset: str) -> Optional[bigquery.Dataset]:
+    # Memoized per (client, project, dataset): location and existence are needed for every lookup.
+    # NotFound is cached as None; transient errors raise and so are retried on the next call.
+    try:
+        return client.get_dataset(f"{project}.{dataset}")
+    except NotFound:
+        return None
+
+
+def _dataset_location(client: bigquery.Client, project: str, dataset: str) -> Optional[str]:
+    # Most deployments keep every dataset in one region; BQ_DEFAULT_LOCATION skips the lookup entirely
+    default_location = os.environ.get("BQ_DEFAULT_LOCATION")
+    if default_location:
+        return default_location
+    try:
+        return getattr(_get_dataset(client, project, dataset), "location", None)
+    except Exception:
+        return None
+
+
 def _run_in_dataset(
     client: bigquery.Client,
     project: str,
     dataset: str,
     sql: str,
-    params: Optional[List[bigquery.ScalarQueryParameter]] = None,
+    params: Optional[List[Any]] = None,
 ):
     # Resolve dataset location to avoid regional mismatches on INFORMATION_SCHEMA views
-    try:
-        ds = client.get_dataset(f"{project}.{dataset}")
-        location = getattr(ds, "location", None)
-    except Exception:
-        location = None
+    location = _dataset_location(client, project, dataset)
     cfg = bigquery.QueryJobConfig(
         default_dataset=bigquery.DatasetReference(project, dataset),
         query_parameters=params or [],
@@ -31,7 +69,6 @@ def _run_in_dataset(
     return client.query(sql, job_config=cfg, location=location)
 
 
-
 EXTRACT_SYSTEM_PROMPT = (
     "You are a SQL analysis assistant. Extract all fully qualified or partially qualified table references "
     "from the user's BigQuery SQL. Return a JSON array where each element has 'project', 'dataset', 'table'. "
@@ -39,41 +76,32 @@ EXTRACT_SYSTEM_PROMPT = (
 )
 
 
-def _llm_extract_tables(sql: str) -> List[ExtractedTable]:
-    agent = Agent(
+def _table_extractor_agent() -> Agent:
+    return Agent(
         name="table_extractor",
         model="gemini-2.5-flash-lite",
         instruction=EXTRACT_SYSTEM_PROMPT,
         tools=[],
     )
-    session_service = InMemorySessionService()
-    app_name = "query_analysis"
-    user_id = "local_user"
-    session_id = "extract_session"
 
+
+def _llm_extract_tables(sql: str) -> List[ExtractedTable]:
     async def _run() -> str:
-        await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        runner = Runner(app_name=app_name, agent=agent, session_service=session_service)
-        msg = Content(role="user", parts=[Part.from_text(text=sql)])
         text_chunks: List[str] = []
-        async for ev in runner.run_async(user_id=user_id, session_id=session_id, new_message=msg):
-            txt = getattr(ev, "text", None)
-            if txt:
-                text_chunks.append(txt)
+        async for txt in run_agent_stream("query_analysis", _table_extractor_agent, sql):
+            text_chunks.append(txt)
         return "\n".join(text_chunks).strip()
 
-    import asyncio
-
     out = asyncio.run(_run())
     tables: List[ExtractedTable] = []
     try:
-        data = json.loads(out)
+        data = _json_loads(out)
         for item in data if isinstance(data, list) else []:
             proj = str(item.get("project", ""))
             dset = str(item.get("dataset", ""))
             tbl = str(item.get("table", ""))
             if dset and tbl:
-                tables.append(ExtractedTable(project=proj, dataset=dset, table=tbl))
+                tables.append(ExtractedTable.model_construct(project=proj, dataset=dset, table=tbl))
     except Exception:
         # Heuristic: none parsed
         pass
@@ -84,324 +112,421 @@ def _resolve_project(maybe_project: str, default_project: str) -> str:
     return maybe_project or default_project
 
 
-_BACKTICK_FQN = re.compile(r"`(?P<project>[\w\-]+)`\.`(?P<dataset>[\w\$]+)`\.`(?P<table>[\w\$]+)`|`(?P<project2>[\w\-]+)\.(?P<dataset2>[\w\$]+)\.(?P<table2>[\w\$]+)`")
-_PLAIN_FQN = re.compile(r"(?P<project>[\w\-]+)\.(?P<dataset>[\w\$]+)\.(?P<table>[\w\$]+)")
-_PLAIN_DSET = re.compile(r"(?P<dataset>[\w\$]+)\.(?P<table>[\w\$]+)")
+# One alternation, tried leftmost-first: `p`.`d`.`t`, `p.d.t`, p.d.t, then d.t. A fully-qualified
+# name is consumed whole, so its dataset.table suffix is not reported a second time. No lookarounds,
+# so the pattern stays valid for re2.
+_TABLE_REF = _re.compile(
+    r"`([\w\-]+)`\.`([\w\$]+)`\.`([\w\$]+)`"
+    r"|`([\w\-]+)\.([\w\$]+)\.([\w\$]+)`"
+    r"|([\w\-]+)\.([\w\$]+)\.([\w\$]+)"
+    r"|([\w\$]+)\.([\w\$]+)"
+)
+
+
+def _iter_table_refs(sql: str) -> Iterator[Tuple[int, str, str, str]]:
+    """Yield (offset, project, dataset, table) for table references in ``sql``; project is "" when unqualified."""
+    if "." not in sql:
+        return
+    for m in _TABLE_REF.finditer(sql):
+        g = m.groups()
+        if g[0]:
+            yield m.start(), g[0], g[1], g[2]
+        elif g[3]:
+            yield m.start(), g[3], g[4], g[5]
+        elif g[6]:
+            yield m.start(), g[6], g[7], g[8]
+        else:
+            # dataset.table -> project filled in by the caller
+            yield m.start(), "", g[9], g[10]
+
+
+@lru_cache(maxsize=1024)
+def _sqlglot_table_refs(sql: str) -> Optional[Tuple[Tuple[str, str, str], ...]]:
+    """Parse ``sql`` with sqlglot and return its (project, dataset, table) references.
+
+    Returns None when sqlglot is unavailable, fails to parse, or finds no tables (it parses scripts
+    such as BEGIN ... END without error but yields nothing), so callers fall back to the regexes.
+    CTE names and other dataset-less identifiers are skipped, as with the regexes. Cached because the
+    same statements recur across audits.
+    """
+    if sqlglot is None:
+        return None
+    try:
+        trees = sqlglot.parse(sql, read="bigquery")
+    except Exception:
+        return None
+    refs: List[Tuple[str, str, str]] = []
+    for tree in trees:
+        if tree is None:
+            continue
+        for t in tree.find_all(_sqlglot_exp.Table):
+            if t.db and t.name:
+                refs.append((t.catalog or "", t.db, t.name))
+    return tuple(refs) or None
+
+
+def _scan_table_refs(sql: str) -> List[Tuple[str, str, str]]:
+    """Return (project, dataset, table) references in ``sql``; project is "" when unqualified.
+
+    Independent of the default project, so parsing (or the compiled patterns) runs once per SQL string.
+    """
+    # Every reference is at least dataset.table; a memchr-backed scan for "." rules most snippets out
+    if "." not in sql:
+        return []
+    refs = _sqlglot_table_refs(sql)
+    if refs is not None:
+        return list(refs)
+    return [(proj, dset, tbl) for _, proj, dset, tbl in _iter_table_refs(sql)]
 
 
 def _regex_extract_tables(sql: str, default_project: str) -> List[ExtractedTable]:
     found: List[ExtractedTable] = []
     seen = set()
-    for m in _BACKTICK_FQN.finditer(sql):
-        proj = m.group("project") or m.group("project2")
-        dset = m.group("dataset") or m.group("dataset2")
-        tbl = m.group("table") or m.group("table2")
-        key = (proj, dset, tbl)
-        if key not in seen:
-            seen.add(key)
-            found.append(ExtractedTable(project=proj, dataset=dset, table=tbl))
-    # Plain fully-qualified
-    for m in _PLAIN_FQN.finditer(sql):
-        proj, dset, tbl = m.group("project"), m.group("dataset"), m.group("table")
-        key = (proj, dset, tbl)
-        if key not in seen:
-            seen.add(key)
-            found.append(ExtractedTable(project=proj, dataset=dset, table=tbl))
-    # dataset.table -> assume default project
-    for m in _PLAIN_DSET.finditer(sql):
-        dset, tbl = m.group("dataset"), m.group("table")
-        key = (default_project, dset, tbl)
+    for proj, dset, tbl in _scan_table_refs(sql):
+        key = (proj or default_project, dset, tbl)
         if key not in seen:
             seen.add(key)
-            found.append(ExtractedTable(project=default_project, dataset=dset, table=tbl))
+            found.append(ExtractedTable.model_construct(project=key[0], dataset=dset, table=tbl))
+    return found
+
+
+def _regex_extract_tables_batch(sqls: List[str], default_project: str) -> List[List[ExtractedTable]]:
+    """Extract tables for many SQL strings: sqlglot per statement, then one regex pass over the rest.
+
+    For the regex pass, no pattern can match across a newline, so joining on "\n" keeps matches within one statement;
+    each match is mapped back to its statement by bisecting the start offsets.
+    """
+    found: List[List[ExtractedTable]] = [[] for _ in sqls]
+    seen = [set() for _ in sqls]
+
+    def _add(i: int, proj: str, dset: str, tbl: str) -> None:
+        key = (proj or default_project, dset, tbl)
+        if key not in seen[i]:
+            seen[i].add(key)
+            found[i].append(ExtractedTable.model_construct(project=key[0], dataset=dset, table=tbl))
+
+    # Statements sqlglot can parse skip the regex pass entirely
+    pending: List[int] = []
+    for i, sql in enumerate(sqls):
+        if "." not in sql:
+            continue
+        refs = _sqlglot_table_refs(sql)
+        if refs is None:
+            pending.append(i)
+        else:
+            for ref in refs:
+                _add(i, *ref)
+    if not pending:
+        return found
+
+    starts: List[int] = []
+    pos = 0
+    for i in pending:
+        starts.append(pos)
+        pos += len(sqls[i]) + 1
+    for offset, proj, dset, tbl in _iter_table_refs("\n".join(sqls[i] for i in pending)):
+        _add(pending[bisect.bisect_right(starts, offset) - 1], proj, dset, tbl)
     return found
 
-def _info_schema_for_table(client: bigquery.Client, project: str, dataset: str, table: str) -> str:
-    # Table metadata via INFORMATION_SCHEMA only (size_bytes, creation_time, table_type)
-    # Use identifier form `{project}.{dataset}`.INFORMATION_SCHEMA.VIEW to avoid parser confusion.
-    lines = [f"Table: {project}.{dataset}.{table}"]
 
-    sql_basic = """
-    SELECT table_type, creation_time
-    FROM `INFORMATION_SCHEMA.TABLES`
-    WHERE table_name = @table
+# One query per INFORMATION_SCHEMA view per dataset, covering every referenced table in that dataset.
+# Rows carry table_name so they can be pivoted back to the per-table report sections.
+_BATCHED_VIEWS: Dict[str, str] = {
+    # TABLES, storage, column count and clustering keys fused into one row per table
+    "CORE": """
+    WITH t AS (
+      SELECT table_name, table_type, creation_time
+      FROM `INFORMATION_SCHEMA.TABLES`
+      WHERE table_name IN UNNEST(@tables)
+    ),
+    s AS ({storage}),
+    c AS (
+      SELECT table_name, COUNT(1) AS column_count,
+             ARRAY_AGG(IF(clustering_ordinal_position IS NULL, NULL, column_name) IGNORE NULLS
+                       ORDER BY clustering_ordinal_position) AS clustering
+      FROM `INFORMATION_SCHEMA.COLUMNS`
+      WHERE table_name IN UNNEST(@tables)
+      GROUP BY table_name
+    )
+    SELECT t.table_name, t.table_type, t.creation_time, s.* EXCEPT (table_name), c.column_count, c.clustering
+    FROM t
+    LEFT JOIN s USING (table_name)
+    LEFT JOIN c USING (table_name)
+    """,
+    # Row caps are applied server-side per table; `total` carries the uncapped count for the report
+    "PARTITIONS": """
+    SELECT table_name, partition_id, total_logical_bytes, last_modified_time,
+           COUNT(*) OVER (PARTITION BY table_name) AS total
+    FROM `INFORMATION_SCHEMA.PARTITIONS`
+    WHERE table_name IN UNNEST(@tables)
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY table_name) <= 3
+    """,
+    # columns_detailed (first 100)
+    "COLUMNS": """
+    SELECT table_name, ordinal_position, column_name, data_type, is_nullable, is_hidden, is_generated,
+           is_system_defined, COUNT(*) OVER (PARTITION BY table_name) AS total
+    FROM `INFORMATION_SCHEMA.COLUMNS`
+    WHERE table_name IN UNNEST(@tables)
+    QUALIFY ordinal_position <= 100
+    ORDER BY table_name, ordinal_position
+    """,
+    # Flattened path listing for nested RECORD schemas
+    "COLUMN_FIELD_PATHS": """
+    SELECT table_name, field_path, data_type,
+           COUNT(*) OVER (PARTITION BY table_name) AS total
+    FROM `INFORMATION_SCHEMA.COLUMN_FIELD_PATHS`
+    WHERE table_name IN UNNEST(@tables)
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY table_name ORDER BY field_path) <= 200
+    ORDER BY table_name, field_path
+    """,
+    # Partitioning, clustering, require_partition_filter, expiration
+    "TABLE_OPTIONS": """
+    SELECT table_name, option_name, option_type, option_value
+    FROM `INFORMATION_SCHEMA.TABLE_OPTIONS`
+    WHERE table_name IN UNNEST(@tables)
+    ORDER BY table_name, option_name
+    """,
+    "VIEWS": """
+    SELECT table_name, view_definition
+    FROM `INFORMATION_SCHEMA.VIEWS`
+    WHERE table_name IN UNNEST(@tables)
+    """,
+    "MATERIALIZED_VIEWS": """
+    SELECT *
+    FROM `INFORMATION_SCHEMA.MATERIALIZED_VIEWS`
+    WHERE table_name IN UNNEST(@tables)
+    """,
+}
+
+# Storage subquery for CORE, chosen by _storage_view()
+_STORAGE_SQL: Dict[str, str] = {
+    # Scan-billed; only used when ADK_USE_TABLE_STORAGE=1
+    "TABLE_STORAGE": """
+      SELECT table_name, total_physical_bytes, total_logical_bytes
+      FROM `INFORMATION_SCHEMA.TABLE_STORAGE`
+      WHERE table_name IN UNNEST(@tables)
+    """,
+    # Free legacy metadata with the same size signal plus row_count
+    "__TABLES__": """
+      SELECT table_id AS table_name, size_bytes, row_count
+      FROM `{project}.{dataset}.__TABLES__`
+      WHERE table_id IN UNNEST(@tables)
+    """,
+}
+
+
+_WIDE_VIEWS = frozenset({"COLUMNS", "COLUMN_FIELD_PATHS"})
+
+# Raw view rows keyed by (project, dataset, SQL, tables); schemas change rarely within a session
+_VIEW_CACHE_TTL_SECONDS = 300.0
+_view_cache = TTLCache(maxsize=256, ttl=_VIEW_CACHE_TTL_SECONDS)
+
+
+def _fetch_view(
+    client: bigquery.Client, project: str, dataset: str, view: str, tables: List[str]
+) -> Dict[str, List[Any]]:
+    """Run one batched INFORMATION_SCHEMA query for ``tables`` and group its rows by table_name.
+
+    Results are reused for ``_VIEW_CACHE_TTL_SECONDS`` so repeated analyses of the same tables skip the query.
     """
-    job_b = _run_in_dataset(
+    sql = _BATCHED_VIEWS[view].replace("{storage}", _STORAGE_SQL[_storage_view()])
+    sql = sql.replace("{project}", project).replace("{dataset}", dataset)
+    key = (project, dataset, sql, tuple(tables))
+    hit = _view_cache.get(key)
+    if hit is not None:
+        return hit
+    job = _run_in_dataset(
         client,
         project,
         dataset,
-        sql_basic,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
+        sql,
+        [bigquery.ArrayQueryParameter("tables", "STRING", tables)],
     )
-    rows_b = list(job_b.result())
-    if rows_b:
-        b = rows_b[0]
+    # Wide tables can return thousands of column rows; stream those over the Storage Read API
+    rows = rows_as_dicts(job) if view in _WIDE_VIEWS else job.result()
+    by_table: Dict[str, List[Any]] = {}
+    for r in rows:
+        by_table.setdefault(r["table_name"], []).append(r)
+    _view_cache.set(key, by_table)
+    return by_table
+
+
+def _storage_view() -> str:
+    # TABLE_STORAGE is billed per scan; __TABLES__ carries size_bytes/row_count for free
+    return "TABLE_STORAGE" if os.environ.get("ADK_USE_TABLE_STORAGE") == "1" else "__TABLES__"
+
+
+def _format_table_core(
+    project: str, dataset: str, table: str, meta: Dict[str, Dict[str, List[Any]]], out: List[str]
+) -> None:
+    # Table metadata via INFORMATION_SCHEMA only (size_bytes, creation_time, table_type)
+    lines = [f"Table: {project}.{dataset}.{table}"]
+
+    core = meta.get("CORE", {}).get(table, [])
+    b = core[0] if core else None
+    if b is not None:
         if b.get('table_type') is not None:
             lines.append(f"  table_type:     {b['table_type']}")
         lines.append(f"  created:        {b['creation_time']}")
 
-    # Storage breakdown (logical/physical bytes)
-    sqls = """
-    SELECT total_physical_bytes, total_logical_bytes
-    FROM `INFORMATION_SCHEMA.TABLE_STORAGE`
-    WHERE table_name = @table
-    """
-    job_s = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sqls,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    stor = list(job_s.result())
-    if stor:
-        s = stor[0]
-        lines.append(f"  physical_bytes: {int(s['total_physical_bytes']) if s['total_physical_bytes'] is not None else 0}")
-        lines.append(f"  logical_bytes:  {int(s['total_logical_bytes']) if s['total_logical_bytes'] is not None else 0}")
+        # Storage breakdown (logical/physical bytes, or __TABLES__ size/rows)
+        keys = set(b.keys())
+        if "total_physical_bytes" in keys:
+            lines.append(f"  physical_bytes: {int(b['total_physical_bytes']) if b['total_physical_bytes'] is not None else 0}")
+            lines.append(f"  logical_bytes:  {int(b['total_logical_bytes']) if b['total_logical_bytes'] is not None else 0}")
+        if "size_bytes" in keys:
+            lines.append(f"  size_bytes:     {int(b['size_bytes']) if b['size_bytes'] is not None else 0}")
+            lines.append(f"  row_count:      {int(b['row_count']) if b['row_count'] is not None else 0}")
 
     # Partitioning/clustering info from INFORMATION_SCHEMA
-    sql2 = """
-    SELECT partition_id, total_logical_bytes, last_modified_time
-    FROM `INFORMATION_SCHEMA.PARTITIONS`
-    WHERE table_name = @table
-    """
-    job2 = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql2,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    parts = list(job2.result())
+    parts = meta.get("PARTITIONS", {}).get(table, [])
     if parts:
-        lines.append(f"  partitions: {len(parts)} (sample of first 3):")
-        for p in parts[:3]:
+        lines.append(f"  partitions: {int(parts[0]['total'])} (sample of first 3):")
+        for p in parts:
             lines.append(f"    partition_id={p.get('partition_id')}, total_logical_bytes={p.get('total_logical_bytes')}")
     else:
         lines.append("  partitions: none")
 
     # Columns info
-    sql3 = """
-    SELECT COUNT(1) AS col_count FROM `INFORMATION_SCHEMA.COLUMNS`
-    WHERE table_name = @table
-    """
-    job3 = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql3,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    cols = list(job3.result())
-    if cols:
-        lines.append(f"  columns: {int(cols[0]['col_count'])}")
+    if "CORE" in meta:
+        lines.append(f"  columns: {int(b['column_count'] or 0) if b is not None else 0}")
 
     # Clustering info
-    sql4 = """
-    SELECT clustering_ordinal_position, column_name
-    FROM `INFORMATION_SCHEMA.COLUMNS`
-    WHERE table_name = @table AND clustering_ordinal_position IS NOT NULL
-    ORDER BY clustering_ordinal_position
-    """
-    job4 = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql4,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    clus = list(job4.result())
+    clus = (b.get("clustering") if b is not None else None) or []
     if clus:
-        names = ", ".join([str(c["column_name"]) for c in clus])
+        names = ", ".join([str(c) for c in clus])
         lines.append(f"  clustering: {names}")
     else:
         lines.append("  clustering: none")
 
-    return "\n".join(lines)
-
-
-def _info_schema_for_dataset(client: bigquery.Client, project: str, dataset: str) -> str:
-    # Dataset table count and sizes via INFORMATION_SCHEMA.TABLES (dataset-scoped)
-    sql = """
-    SELECT COUNT(*) AS table_count
-    FROM `INFORMATION_SCHEMA.TABLES`
-    """
-    job = _run_in_dataset(client, project, dataset, sql)
-    rows = list(job.result())
-    lines = [f"Dataset: {project}.{dataset}"]
-    if rows:
-        r = rows[0]
-        lines.append(f"  tables:        {int(r['table_count']) if r['table_count'] is not None else 0}")
-
-    # Storage totals
-    sqls = """
-    SELECT SUM(total_logical_bytes) AS total_logical_bytes,
-           SUM(total_physical_bytes) AS total_physical_bytes
-    FROM `INFORMATION_SCHEMA.TABLE_STORAGE`
-    """
-    jobs = _run_in_dataset(client, project, dataset, sqls)
-    rows2 = list(jobs.result())
-    if rows2:
-        r2 = rows2[0]
-        lines.append(f"  logical_bytes:  {int(r2['total_logical_bytes']) if r2['total_logical_bytes'] is not None else 0}")
-        lines.append(f"  physical_bytes: {int(r2['total_physical_bytes']) if r2['total_physical_bytes'] is not None else 0}")
-    return "\n".join(lines)
+    out.append("\n".join(lines))
 
 
-def _dataset_api_totals(client: bigquery.Client, project: str, dataset: str) -> str:
-    total_bytes = 0
-    table_count = 0
-    try:
-        for tbl in client.list_tables(f"{project}.{dataset}"):
-            try:
-                t = client.get_table(tbl.reference)
-                total_bytes += int(getattr(t, "num_bytes", 0) or 0)
-                table_count += 1
-            except Exception:
-                continue
-    except Exception as e:
-        return f"Dataset API totals error: {e}"
-    return f"Dataset API totals: tables={table_count}, sum_num_bytes={total_bytes}"
-
-
-def _info_schema_table_options(client: bigquery.Client, project: str, dataset: str, table: str) -> List[str]:
-    # Partitioning, clustering, require_partition_filter, expiration
-    sql = """
-    SELECT option_name, option_type, option_value
-    FROM `INFORMATION_SCHEMA.TABLE_OPTIONS`
-    WHERE table_name = @table
-    ORDER BY option_name
-    """
-    job = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    opts = list(job.result())
-    lines: List[str] = []
+def _format_table_options(opts: List[Any], out: List[str]) -> None:
     if opts:
-        lines.append("  options:")
+        out.append("  options:")
         for o in opts:
-            lines.append(f"    {o['option_name']}: {o['option_value']}")
-    return lines
+            out.append(f"    {o['option_name']}: {o['option_value']}")
 
 
-def _info_schema_columns_detailed(client: bigquery.Client, project: str, dataset: str, table: str) -> List[str]:
-    sql = """
-    SELECT ordinal_position, column_name, data_type, is_nullable, is_hidden, is_generated, is_system_defined
-    FROM `INFORMATION_SCHEMA.COLUMNS`
-    WHERE table_name = @table
-    ORDER BY ordinal_position
-    """
-    job = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    rows = list(job.result())
-    lines: List[str] = []
+def _format_columns_detailed(rows: List[Any], out: List[str]) -> None:
     if rows:
-        lines.append("  columns_detailed:")
-        for r in rows[:100]:  # cap to first 100 for readability
-            lines.append(
+        out.append("  columns_detailed:")
+        for r in rows:
+            out.append(
                 f"    {int(r['ordinal_position'])}. {r['column_name']}: {r['data_type']}, nullable={r['is_nullable']}, hidden={r['is_hidden']}, generated={r['is_generated']}, system={r['is_system_defined']}"
             )
-        if len(rows) > 100:
-            lines.append(f"    ... and {len(rows) - 100} more columns")
-    return lines
+        total = int(rows[0]['total'])
+        if total > 100:
+            out.append(f"    ... and {total - 100} more columns")
 
 
-def _info_schema_column_field_paths(client: bigquery.Client, project: str, dataset: str, table: str) -> List[str]:
-    # Flattened path listing for nested RECORD schemas
-    sql = """
-    SELECT field_path, data_type
-    FROM `INFORMATION_SCHEMA.COLUMN_FIELD_PATHS`
-    WHERE table_name = @table
-    ORDER BY field_path
-    """
-    job = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    rows = list(job.result())
-    lines: List[str] = []
+def _format_column_field_paths(rows: List[Any], out: List[str]) -> None:
     if rows:
-        lines.append("  column_field_paths:")
-        for r in rows[:200]:
-            lines.append(f"    {r['field_path']}: {r['data_type']}")
-        if len(rows) > 200:
-            lines.append(f"    ... and {len(rows) - 200} more field paths")
-    return lines
+        out.append("  column_field_paths:")
+        for r in rows:
+            out.append(f"    {r['field_path']}: {r['data_type']}")
+        total = int(rows[0]['total'])
+        if total > 200:
+            out.append(f"    ... and {total - 200} more field paths")
 
 
-def _info_schema_views_info(client: bigquery.Client, project: str, dataset: str, table: str) -> List[str]:
+def _format_views_info(rows: List[Any], out: List[str]) -> None:
     # For views: definition (snippet)
-    sql = """
-    SELECT view_definition
-    FROM `INFORMATION_SCHEMA.VIEWS`
-    WHERE table_name = @table
-    """
-    job = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    rows = list(job.result())
-    lines: List[str] = []
     if rows:
         v = rows[0]
-        lines.append("  view:")
+        out.append("  view:")
         # Truncate definition for readability
         defn = str(v.get('view_definition') or '')
         if defn:
             snippet = defn if len(defn) <= 1000 else defn[:1000] + " ... (truncated)"
-            lines.append("    view_definition_snippet:")
+            out.append("    view_definition_snippet:")
             for ln in snippet.splitlines()[:20]:
-                lines.append("      " + ln)
-    return lines
+                out.append("      " + ln)
 
 
-def _info_schema_mviews_info(client: bigquery.Client, project: str, dataset: str, table: str) -> List[str]:
+def _format_mviews_info(rows: List[Any], out: List[str]) -> None:
     # Materialized view metadata (if applicable)
-    sql = """
-    SELECT *
-    FROM `INFORMATION_SCHEMA.MATERIALIZED_VIEWS`
-    WHERE table_name = @table
-    """
-    job = _run_in_dataset(
-        client,
-        project,
-        dataset,
-        sql,
-        [bigquery.ScalarQueryParameter("table", "STRING", table)],
-    )
-    rows = list(job.result())
-    lines: List[str] = []
     if rows:
         mv = rows[0]
-        lines.append("  materialized_view:")
+        out.append("  materialized_view:")
         for k in mv.keys():
             val = mv.get(k)
             # Avoid dumping huge strings
             if isinstance(val, str) and len(val) > 500:
                 val = val[:500] + " ... (truncated)"
-            lines.append(f"    {k}: {val}")
-    return lines
+            out.append(f"    {k}: {val}")
+
+
+_DATASET_CACHE_MAX_ENTRIES = 256
+
+
+def _ttl_cached_by_dataset(fn: Callable[..., str]) -> Callable[..., str]:
+    """Cache ``fn(client, project, dataset)`` per (project, dataset) for ``_VIEW_CACHE_TTL_SECONDS``."""
+    cache = TTLCache(maxsize=_DATASET_CACHE_MAX_ENTRIES, ttl=_VIEW_CACHE_TTL_SECONDS)
+
+    @wraps(fn)
+    def wrapper(client: bigquery.Client, project: str, dataset: str) -> str:
+        key = (project, dataset)
+        value = cache.get(key)
+        if value is None:
+            value = fn(client, project, dataset)
+            cache.set(key, value)
+        return value
+
+    return wrapper
+
+
+# Dataset-wide storage totals, from the same source _storage_view() picks for CORE
+_STORAGE_TOTALS_SQL: Dict[str, str] = {
+    "TABLE_STORAGE": """
+      SELECT COUNT(*) AS table_count,
+             SUM(total_logical_bytes) AS total_logical_bytes,
+             SUM(total_physical_bytes) AS total_physical_bytes
+      FROM `INFORMATION_SCHEMA.TABLE_STORAGE`
+    """,
+    "__TABLES__": """
+      SELECT COUNT(*) AS table_count, SUM(size_bytes) AS size_bytes, SUM(row_count) AS row_count
+      FROM `{project}.{dataset}.__TABLES__`
+    """,
+}
+
+
+@_ttl_cached_by_dataset
+def _dataset_totals(client: bigquery.Client, project: str, dataset: str) -> str:
+    # One storage aggregate feeds both the dataset summary and the API-style totals line
+    view = _storage_view()
+    sql = _STORAGE_TOTALS_SQL[view].replace("{project}", project).replace("{dataset}", dataset)
+    try:
+        r = next(iter(_run_in_dataset(client, project, dataset, sql).result()), None)
+    except Exception:
+        if view == "__TABLES__":
+            raise
+        # TABLE_STORAGE opted into but unavailable: fall back to the free legacy metadata
+        sql = _STORAGE_TOTALS_SQL["__TABLES__"].replace("{project}", project).replace("{dataset}", dataset)
+        r = next(iter(_run_in_dataset(client, project, dataset, sql).result()), None)
+    r = dict(r.items()) if r is not None else {}
+
+    def _int(name: str) -> int:
+        return int(r[name]) if r.get(name) is not None else 0
+
+    table_count = _int("table_count")
+    lines = [f"Dataset: {project}.{dataset}", f"  tables:        {table_count}"]
+    if "total_physical_bytes" in r:
+        total_bytes = _int("total_logical_bytes")
+        lines.append(f"  logical_bytes:  {total_bytes}")
+        lines.append(f"  physical_bytes: {_int('total_physical_bytes')}")
+    else:
+        total_bytes = _int("size_bytes")
+        lines.append(f"  size_bytes:     {total_bytes}")
+        lines.append(f"  row_count:      {_int('row_count')}")
+    lines.append(f"Dataset API totals: tables={table_count}, sum_num_bytes={total_bytes}")
+    return "\n".join(lines)
 
 
 def _dataset_exists(client: bigquery.Client, project: str, dataset: str) -> bool:
     try:
-        client.get_dataset(f"{project}.{dataset}")
-        return True
+        return _get_dataset(client, project, dataset) is not None
     except Exception:
         return False
 
@@ -472,10 +597,9 @@ def _job_diagnostics_compact(client: bigquery.Client, project: str, job_id: str)
     job = client.query(sql, job_config=bigquery.QueryJobConfig(
         query_parameters=[bigquery.ScalarQueryParameter("job_id", "STRING", job_id)]
     ))
-    rows = list(job.result())
+    r = next(iter(job.result(max_results=1)), None)
     lines: List[str] = []
-    if rows:
-        r = rows[0]
+    if r is not None:
         lines.append("## Job Diagnostics (compact)")
         for k in [
             "job_id","user_email","job_type","state","start_time","end_time",
@@ -494,82 +618,98 @@ def _job_diagnostics_compact(client: bigquery.Client, project: str, job_id: str)
     return lines
 
 
+_MAX_CONCURRENT_LOOKUPS = 16
+
+
+def _call_lookup(call: Tuple[Callable[..., Any], tuple]) -> Any:
+    """Run one blocking metadata lookup; a failed lookup yields its exception instead of a value."""
+    fn, args = call
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
 def query_analysis_tool(params: QueryAnalysisInput) -> QueryAnalysisOutput:
-    # Step 1: Table extraction via LLM
-    extracted = _llm_extract_tables(params.sql)
+    # Step 1: Table extraction: sqlglot AST first; the LLM only when parsing fails or finds nothing
+    extracted: List[ExtractedTable] = []
+    if _sqlglot_table_refs(params.sql):
+        extracted = _regex_extract_tables(params.sql, params.project)
+    if not extracted:
+        extracted = _llm_extract_tables(params.sql)
     if not extracted:
         extracted = _regex_extract_tables(params.sql, params.project)
 
     # Step 2: INFORMATION_SCHEMA lookups
-    client = bigquery.Client(project=params.project)
+    client = get_bq_client(params.project)
     lines: List[str] = []
-    seen_datasets = set()
     resolved: List[ExtractedTable] = []
     notes: List[str] = []
     compact_mode = bool(os.environ.get("ADK_COMPACT_V2"))
 
+    # Group tables per dataset so each INFORMATION_SCHEMA view is queried once per dataset
+    # One existence check per local dataset, run concurrently
+    candidates = list(dict.fromkeys(
+        (params.project, t.dataset) for t in extracted if _resolve_project(t.project, params.project) == params.project
+    ))
+    with ThreadPoolExecutor(max_workers=_MAX_CONCURRENT_LOOKUPS) as ex:
+        exists = dict(zip(candidates, ex.map(lambda k: _dataset_exists(client, *k), candidates)))
+
+    buckets: Dict[Tuple[str, str], List[str]] = {}
     for t in extracted:
         proj = _resolve_project(t.project, params.project)
         # Local-only enforcement
         if proj != params.project:
             notes.append(f"Skipping external table: {proj}.{t.dataset}.{t.table}")
             continue
-        if not _dataset_exists(client, proj, t.dataset):
+        if not exists[(proj, t.dataset)]:
             notes.append(f"Skipping table: Dataset {proj}.{t.dataset} not found in current project.")
             continue
 
-        resolved.append(ExtractedTable(project=proj, dataset=t.dataset, table=t.table))
-
-        # Table core
-        try:
-            lines.append(_info_schema_for_table(client, proj, t.dataset, t.table))
-        except Exception as e:
-            notes.append(f"Error TABLES/TABLE_STORAGE/PARTITIONS/COLUMNS for {proj}.{t.dataset}.{t.table}: {e}")
-
-        # Options
-        try:
-            lines.extend(_info_schema_table_options(client, proj, t.dataset, t.table))
-        except Exception as e:
-            notes.append(f"Error TABLE_OPTIONS for {proj}.{t.dataset}.{t.table}: {e}")
-
-        if not compact_mode:
-            try:
-                lines.extend(_info_schema_columns_detailed(client, proj, t.dataset, t.table))
-            except Exception as e:
-                notes.append(f"Error detailed COLUMNS for {proj}.{t.dataset}.{t.table}: {e}")
-            try:
-                lines.extend(_info_schema_column_field_paths(client, proj, t.dataset, t.table))
-            except Exception as e:
-                notes.append(f"Error COLUMN_FIELD_PATHS for {proj}.{t.dataset}.{t.table}: {e}")
-
-        # Views / Materialized views
-        try:
-            lines.extend(_info_schema_views_info(client, proj, t.dataset, t.table))
-        except Exception as e:
-            notes.append(f"Error VIEWS for {proj}.{t.dataset}.{t.table}: {e}")
-        try:
-            lines.extend(_info_schema_mviews_info(client, proj, t.dataset, t.table))
-        except Exception as e:
-            notes.append(f"Error MATERIALIZED_VIEWS for {proj}.{t.dataset}.{t.table}: {e}")
-
+        resolved.append(ExtractedTable.model_construct(project=proj, dataset=t.dataset, table=t.table))
+        tables = buckets.setdefault((proj, t.dataset), [])
+        if t.table not in tables:
+            tables.append(t.table)
+
+    # Compact reports omit the detailed column listings; CORE already has the count and clustering keys
+    skipped = {"COLUMNS", "COLUMN_FIELD_PATHS"} if compact_mode else set()
+    views = [v for v in _BATCHED_VIEWS if v not in skipped]
+    # Each lookup is (result key, error note prefix, helper, args)
+    lookups: List[Tuple[tuple, str, Callable[..., Any], tuple]] = []
+    for (proj, dset), tables in buckets.items():
+        for view in views:
+            lookups.append((("view", proj, dset, view), f"Error {view} for {proj}.{dset}", _fetch_view, (client, proj, dset, view, tables)))
         # API enrichments
-        try:
-            lines.extend(_table_api_details(client, proj, t.dataset, t.table))
-        except Exception as e:
-            notes.append(f"Error API details for {proj}.{t.dataset}.{t.table}: {e}")
-
-        key = (proj, t.dataset)
-        if key not in seen_datasets:
-            seen_datasets.add(key)
-            try:
-                lines.append(_info_schema_for_dataset(client, proj, t.dataset))
-            except Exception as e:
-                notes.append(f"Error dataset totals for {proj}.{t.dataset}: {e}")
-            # Add API totals fallback so report still has dataset size signal
-            try:
-                lines.append(_dataset_api_totals(client, proj, t.dataset))
-            except Exception as e:
-                notes.append(f"Error dataset API totals for {proj}.{t.dataset}: {e}")
+        for tbl in tables:
+            lookups.append((("api", proj, dset, tbl), f"Error API details for {proj}.{dset}.{tbl}", _table_api_details, (client, proj, dset, tbl)))
+        lookups.append((("dataset", proj, dset), f"Error dataset totals for {proj}.{dset}", _dataset_totals, (client, proj, dset)))
+
+    # Blocking lookups on a plain thread pool (no event loop: ADK may call this tool from its own);
+    # results keep the order of lookups
+    with ThreadPoolExecutor(max_workers=_MAX_CONCURRENT_LOOKUPS) as ex:
+        results = list(ex.map(_call_lookup, [(fn, args) for _, _, fn, args in lookups]))
+    found: Dict[tuple, Any] = {}
+    for (key, error_prefix, _, _), res in zip(lookups, results):
+        if isinstance(res, BaseException):
+            notes.append(f"{error_prefix}: {res}")
+        else:
+            found[key] = res
+
+    # Stitch the per-table sections back together from the pivoted view rows
+    for (proj, dset), tables in buckets.items():
+        meta = {v: found[("view", proj, dset, v)] for v in views if ("view", proj, dset, v) in found}
+        for tbl in tables:
+            _format_table_core(proj, dset, tbl, meta, lines)
+            _format_table_options(meta.get("TABLE_OPTIONS", {}).get(tbl, []), lines)
+            if not compact_mode:
+                _format_columns_detailed(meta.get("COLUMNS", {}).get(tbl, []), lines)
+                _format_column_field_paths(meta.get("COLUMN_FIELD_PATHS", {}).get(tbl, []), lines)
+            # Views / Materialized views
+            _format_views_info(meta.get("VIEWS", {}).get(tbl, []), lines)
+            _format_mviews_info(meta.get("MATERIALIZED_VIEWS", {}).get(tbl, []), lines)
+            lines.extend(found.get(("api", proj, dset, tbl), []))
+        if ("dataset", proj, dset) in found:
+            lines.append(found[("dataset", proj, dset)])
 
     # Optional: job diagnostics for a specific job_id from regional INFORMATION_SCHEMA.JOBS
     if params.job_id:
@@ -596,10 +736,19 @@ def query_analysis_tool(params: QueryAnalysisInput) -> QueryAnalysisOutput:
         "",
         "# BigQuery Schema Metadata",
     ]
-    body = ("\n\n".join(lines) if lines else "No metadata found.")
-    notes_section = ("\n\n## Notes\n" + "\n".join(notes)) if notes else ""
-    with open(meta_path, "w") as fp:
-        fp.write("\n".join(header) + "\n\n" + body + notes_section)
+    # Stream the blocks out through a 1 MiB buffer instead of joining the whole body into one string first
+    with open(meta_path, "wb", buffering=1 << 20) as fp:
+        fp.write(("\n".join(header) + "\n\n").encode())
+        if lines:
+            fp.write(lines[0].encode())
+            for chunk in lines[1:]:
+                fp.write(b"\n\n")
+                fp.write(chunk.encode())
+        else:
+            fp.write(b"No metadata found.")
+        if notes:
+            fp.write(b"\n\n## Notes\n")
+            fp.write("\n".join(notes).encode())
 
     return QueryAnalysisOutput(tables=resolved, metadata_file=meta_path, notes=("\n".join(notes) if notes else ("" if extracted else "No tables extracted; check SQL.")))
 
@@ -1,5 +1,6 @@
 from typing import List
 import os
+import re
 from ..schemas import OptimizeInput, OptimizeOutput
 
 
@@ -10,16 +11,31 @@ SYSTEM_PROMPT = (
 )
 
 
+# Every needle the local rules look for, matched case-insensitively in a single pass
+_RULE_NEEDLES = re.compile(
+    r"(?P<star>SELECT \*)"
+    r"|(?P<public>FROM[ \n]`BIGQUERY-PUBLIC-DATA)"
+    r"|(?P<year>WHERE YEAR\(|EXTRACT\(YEAR)"
+    r"|(?P<order>ORDER BY)"
+    r"|(?P<limit>LIMIT)",
+    re.IGNORECASE,
+)
+
+
 def _local_rules(sql: str) -> List[str]:
     recs: List[str] = []
-    s = sql.upper()
-    if "SELECT *" in s:
+    hits = set()
+    for m in _RULE_NEEDLES.finditer(sql):
+        hits.add(m.lastgroup)
+        if len(hits) == 5:
+            break
+    if "star" in hits:
         recs.append("Avoid SELECT *; project only required columns to reduce scanned bytes.")
-    if "FROM `BIGQUERY-PUBLIC-DATA" in s or "FROM\n`BIGQUERY-PUBLIC-DATA" in s:
+    if "public" in hits:
         recs.append("Consider creating a filtered/materialized table for frequently accessed subsets of public datasets.")
-    if "WHERE YEAR(" in s or "EXTRACT(YEAR" in s:
+    if "year" in hits:
         recs.append("If tables are partitioned by date/timestamp, filter on the partition column to prune partitions.")
-    if "ORDER BY" in s and "LIMIT" in s:
+    if "order" in hits and "limit" in hits:
         recs.append("Use approximate aggregations or pre-aggregated tables if ORDER BY LIMIT causes large scans.")
     return recs
 
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 import argparse
 import csv
+import functools
+import heapq
+import itertools
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
 
-import pytz  # noqa: F401  # kept for potential timezone handling
 from google.cloud import bigquery
 from .optimizer import query_optimizer_tool
 
@@ -15,7 +18,7 @@ US_REGIONAL_INFO_SCHEMA = "`region-us`.INFORMATION_SCHEMA.JOBS_BY_PROJECT"
 EU_REGIONAL_INFO_SCHEMA = "`region-eu`.INFORMATION_SCHEMA.JOBS_BY_PROJECT"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class JobStat:
     location: str
     job_id: str
@@ -39,7 +42,8 @@ def _parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--outfile",
         default="bq_job_stats.csv",
-        help="Path to write the CSV with job stats (default: bq_job_stats.csv)",
+        help="Path to write the CSV with job stats (default: bq_job_stats.csv); pass an empty string to skip"
+        " the CSV and rank the window's top jobs in BigQuery instead",
     )
     parser.add_argument(
         "--locations",
@@ -53,128 +57,268 @@ def _parse_args() -> argparse.Namespace:
         default=5,
         help="Number of most expensive jobs to print (default: 5)",
     )
+    parser.add_argument(
+        "--max_bytes_billed",
+        type=int,
+        default=10 * 1024 ** 3,
+        help="Fail any audit query that would bill more than this many bytes (default: 10 GiB; 0 disables)",
+    )
     return parser.parse_args()
 
 
-def _jobs_query_sql(days: int, limit: int, schema: str) -> str:
+_ORDER_RECENT = "creation_time DESC"
+_ORDER_COST = "total_bytes_billed DESC, total_slot_ms DESC"
+
+
+_TS_FORMAT = "%Y-%m-%d %H:%M:%E6S+00:00"
+
+
+@functools.lru_cache(maxsize=None)
+def _jobs_query_sql(schema: str, order_by: str = _ORDER_RECENT) -> str:
+    # @days/@lim are query parameters so identical shapes share BigQuery's cache; the text only
+    # varies by region view and ordering, so each variant is built once per process.
+    # NULLs are filled and timestamps rendered server-side, so rows map straight onto JobStat;
+    # the select list follows JobStat's field order so rows can be passed positionally.
     return (
-        "SELECT job_id, user_email, creation_time, end_time, total_bytes_processed, "
-        "total_bytes_billed, total_slot_ms, statement_type, query "
+        "SELECT job_id, IFNULL(user_email, '') AS user_email, "
+        f"IFNULL(FORMAT_TIMESTAMP({_TS_FORMAT!r}, creation_time, 'UTC'), '') AS creation_time, "
+        f"IFNULL(FORMAT_TIMESTAMP({_TS_FORMAT!r}, end_time, 'UTC'), '') AS end_time, "
+        "IFNULL(total_bytes_processed, 0) AS total_bytes_processed, "
+        "IFNULL(total_bytes_billed, 0) AS total_bytes_billed, "
+        "IFNULL(total_slot_ms, 0) AS total_slot_ms, statement_type, query "
         f"FROM {schema} "
         "WHERE job_type = \"QUERY\" "
-        f"AND creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY) "
-        f"ORDER BY creation_time DESC LIMIT {limit}"
+        "AND creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @days DAY) "
+        f"ORDER BY {order_by} LIMIT @lim"
     )
 
 
+_SCHEMAS = {"US": US_REGIONAL_INFO_SCHEMA, "EU": EU_REGIONAL_INFO_SCHEMA}
+
+
 def _pick_schema_for_location(location: str) -> str:
-    loc = location.upper()
-    if loc == "US":
-        return US_REGIONAL_INFO_SCHEMA
-    if loc == "EU":
-        return EU_REGIONAL_INFO_SCHEMA
-    raise ValueError(f"Unsupported location '{location}'. Use US or EU.")
+    schema = _SCHEMAS.get(location.upper())
+    if schema is None:
+        raise ValueError(f"Unsupported location '{location}'. Use {' or '.join(_SCHEMAS)}.")
+    return schema
+
+
+_MAX_PAGE_ROWS = 10_000
+
 
+def _page_size(limit: int) -> int:
+    # Rows are consumed straight off the iterator; size pages to the LIMIT so small audits take one round trip
+    return max(1, min(limit, _MAX_PAGE_ROWS))
 
-def _fetch_jobs(client: bigquery.Client, location: str, days: int, limit: int) -> List[JobStat]:
+
+def _run_jobs_query(
+    client: bigquery.Client,
+    location: str,
+    days: int,
+    limit: int,
+    order_by: str = _ORDER_RECENT,
+    max_bytes_billed: int = 0,
+) -> bigquery.QueryJob:
+    """Run the JOBS query for ``location`` and return the finished job; rows are read via ``_iter_job_stats``."""
     schema = _pick_schema_for_location(location)
-    sql = _jobs_query_sql(days=days, limit=limit, schema=schema)
-    job = client.query(sql, location=location)
-    rows = list(job.result())
-    stats: List[JobStat] = []
-    for r in rows:
-        stats.append(
-            JobStat(
-                location=location,
-                job_id=str(r["job_id"]),
-                user_email=str(r["user_email"]) if r["user_email"] is not None else "",
-                creation_time=str(r["creation_time"]) if r["creation_time"] is not None else "",
-                end_time=str(r["end_time"]) if r["end_time"] is not None else "",
-                total_bytes_processed=int(r["total_bytes_processed"]) if r["total_bytes_processed"] is not None else 0,
-                total_bytes_billed=int(r["total_bytes_billed"]) if r["total_bytes_billed"] is not None else 0,
-                total_slot_ms=int(r["total_slot_ms"]) if r["total_slot_ms"] is not None else 0,
-                statement_type=str(r["statement_type"]) if r["statement_type"] is not None else None,
-                query=str(r["query"]) if r["query"] is not None else None,
-            )
-        )
-    return stats
+    sql = _jobs_query_sql(schema, order_by)
+    cfg = bigquery.QueryJobConfig(
+        use_query_cache=True,
+        maximum_bytes_billed=max_bytes_billed or None,
+        query_parameters=[
+            bigquery.ScalarQueryParameter("days", "INT64", days),
+            bigquery.ScalarQueryParameter("lim", "INT64", limit),
+        ],
+    )
+    job = client.query(sql, job_config=cfg, location=location)
+    job.result(page_size=_page_size(limit))  # wait here so regions finish concurrently
+    return job
 
 
-def _most_expensive(jobs: List[JobStat]) -> Optional[JobStat]:
-    if not jobs:
+@functools.lru_cache(maxsize=8)
+def _client(project: str) -> bigquery.Client:
+    """Return a shared BigQuery client (and its authorized HTTP session) for ``project``."""
+    return bigquery.Client(project=project)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_bqstorage_client():
+    """Return a shared BigQuery Storage read client, or None when pyarrow/bigquery-storage are missing."""
+    try:
+        import pyarrow  # noqa: F401
+        from google.cloud import bigquery_storage
+        return bigquery_storage.BigQueryReadClient()
+    except Exception:
         return None
-    return max(jobs, key=lambda j: (j.total_bytes_billed, j.total_slot_ms))
 
 
-def _top_n_most_expensive(jobs: List[JobStat], n: int) -> List[JobStat]:
-    """Return the top N jobs by billed bytes (tie-breaker: total_slot_ms)."""
+def _iter_job_stats(location: str, job: bigquery.QueryJob, page_size: int) -> Iterator[JobStat]:
+    bqstorage_client = _get_bqstorage_client()
+    if bqstorage_client is not None:
+        started = False
+        try:
+            # Columnar Arrow batches over the Storage Read API, decoded in C one batch at a time
+            for batch in job.result(page_size=page_size).to_arrow_iterable(bqstorage_client=bqstorage_client):
+                started = True
+                for vals in zip(*(col.to_pylist() for col in batch.columns)):
+                    yield JobStat(location, *vals)
+            return
+        except Exception:
+            if started:
+                raise  # rows were already emitted; restarting over REST would duplicate them
+            # e.g. Storage API disabled or no bigquery.readsessions.create: fall back to REST paging
+    # A fresh row iterator: the Arrow attempt has already started the previous one
+    for r in job.result(page_size=page_size):
+        yield JobStat(location, *r.values())
+
+
+_RANK_CHUNK_ROWS = 65536
+_NUMPY_RANK_MIN_ROWS = 100_000
+
+
+def _select_top(jobs: List[JobStat], n: int) -> List[JobStat]:
+    import numpy as np
+
+    billed = np.fromiter((j.total_bytes_billed for j in jobs), dtype=np.int64, count=len(jobs))
+    slot = np.fromiter((j.total_slot_ms for j in jobs), dtype=np.int64, count=len(jobs))
+    if len(jobs) > n:
+        # O(N) selection on billed bytes; keep every row tied with the n-th largest for the slot tie-break
+        kth = np.partition(billed, len(jobs) - n)[len(jobs) - n]
+        cand = np.flatnonzero(billed >= kth)
+    else:
+        cand = np.arange(len(jobs))
+    # Descending (billed, slot); earlier rows first among equal keys
+    order = cand[np.lexsort((cand, -slot[cand], -billed[cand]))]
+    return [jobs[i] for i in order[:n]]
+
+
+def _top_n_most_expensive(jobs: Iterable[JobStat], n: int, max_rows: int = 0) -> List[JobStat]:
+    """Return the top N jobs by billed bytes (tie-breaker: total_slot_ms).
+
+    ``max_rows`` is the most rows the stream can carry (LIMIT x locations). Below
+    ``_NUMPY_RANK_MIN_ROWS`` (e.g. the default ``--limit 1000``) a bounded ``heapq.nlargest`` runs
+    straight over the stream, which beats building NumPy arrays at that size. Larger audits are ranked
+    in chunks of ``_RANK_CHUNK_ROWS`` with NumPy partitioning, carrying the current top N into the next
+    chunk. Either way only N rows (plus one chunk) are held, however many stream past.
+    """
     if n <= 0:
         return []
-    return sorted(
-        jobs,
-        key=lambda j: (j.total_bytes_billed, j.total_slot_ms),
-        reverse=True,
-    )[:n]
-
-
-
-
-def _write_csv(path: str, jobs: List[JobStat]) -> None:
-    fieldnames = [
-        "location",
-        "job_id",
-        "user_email",
-        "creation_time",
-        "end_time",
-        "total_bytes_processed",
-        "total_bytes_billed",
-        "total_slot_ms",
-        "statement_type",
-        "query",
-    ]
-    with open(path, "w", newline="") as fp:
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        for j in jobs:
-            writer.writerow(
-                {
-                    "location": j.location,
-                    "job_id": j.job_id,
-                    "user_email": j.user_email,
-                    "creation_time": j.creation_time,
-                    "end_time": j.end_time,
-                    "total_bytes_processed": j.total_bytes_processed,
-                    "total_bytes_billed": j.total_bytes_billed,
-                    "total_slot_ms": j.total_slot_ms,
-                    "statement_type": j.statement_type or "",
-                    "query": j.query or "",
-                }
+    if max_rows < _NUMPY_RANK_MIN_ROWS:
+        return heapq.nlargest(n, jobs, key=lambda j: (j.total_bytes_billed, j.total_slot_ms))
+    best: List[JobStat] = []
+    it = iter(jobs)
+    while True:
+        chunk = list(itertools.islice(it, _RANK_CHUNK_ROWS))
+        if not chunk:
+            return best
+        best = _select_top(best + chunk, n)
+
+
+_CSV_FIELDS = [
+    "location",
+    "job_id",
+    "user_email",
+    "creation_time",
+    "end_time",
+    "total_bytes_processed",
+    "total_bytes_billed",
+    "total_slot_ms",
+    "statement_type",
+    "query",
+]
+
+
+_CSV_BATCH_ROWS = 1000
+
+
+def _write_csv(fp: IO[str], jobs: Iterable[JobStat]) -> Iterator[JobStat]:
+    """Write ``jobs`` to ``fp`` as they stream past, yielding each one on for further processing.
+
+    Rows are handed to ``writerows`` in batches of ``_CSV_BATCH_ROWS`` so the csv loop runs in C.
+    """
+    writer = csv.writer(fp)
+    writer.writerow(_CSV_FIELDS)
+    it = iter(jobs)
+    while True:
+        batch = list(itertools.islice(it, _CSV_BATCH_ROWS))
+        if not batch:
+            return
+        # Plain tuples in _CSV_FIELDS order: no per-row dict for DictWriter to look up again
+        writer.writerows(
+            (
+                j.location,
+                j.job_id,
+                j.user_email,
+                j.creation_time,
+                j.end_time,
+                j.total_bytes_processed,
+                j.total_bytes_billed,
+                j.total_slot_ms,
+                j.statement_type or "",
+                j.query or "",
             )
+            for j in batch
+        )
+        yield from batch
 
 
-def main() -> int:
-    args = _parse_args()
-    client = bigquery.Client(project=args.project)
-    locations = [s.strip() for s in args.locations.split(",") if s.strip()]
-
-    all_jobs: List[JobStat] = []
-    for loc in locations:
+def _iter_all_locations(results: List[Tuple[str, bigquery.QueryJob]], page_size: int) -> Iterator[JobStat]:
+    for loc, job in results:
         try:
-            all_jobs.extend(_fetch_jobs(client, loc, args.days, args.limit))
+            yield from _iter_job_stats(loc, job, page_size)
         except Exception as exc:  # noqa: BLE001
             print(f"Warning: failed fetching jobs from {loc}: {exc}", file=sys.stderr)
 
-    if not all_jobs:
-        print("No jobs found in the specified window/locations.")
-        return 0
 
-    _write_csv(args.outfile, all_jobs)
+def main() -> int:
+    args = _parse_args()
+    client = _client(args.project)
+    locations = [s.strip() for s in args.locations.split(",") if s.strip()]
 
-    top = _most_expensive(all_jobs)
-    if top is None:
-        print("No query jobs found.")
+    n = max(args.topn, 1)
+    if args.outfile:
+        limit, order_by = args.limit, _ORDER_RECENT
+    else:
+        # No CSV wanted: let BigQuery rank the window and ship only the top rows
+        limit, order_by = n, _ORDER_COST
+
+    # Regions are independent round-trips; run them concurrently, keep results in --locations order
+    results: List[Tuple[str, bigquery.QueryJob]] = []
+    with ThreadPoolExecutor(max_workers=max(1, len(locations))) as ex:
+        futures = [
+            (loc, ex.submit(_run_jobs_query, client, loc, args.days, limit, order_by, args.max_bytes_billed))
+            for loc in locations
+        ]
+        for loc, fut in futures:
+            try:
+                results.append((loc, fut.result()))
+            except Exception as exc:  # noqa: BLE001
+                print(f"Warning: failed fetching jobs from {loc}: {exc}", file=sys.stderr)
+
+    # Single streaming pass: each row goes to the CSV and through a bounded top-N heap, never into a list
+    page_size, max_rows = _page_size(limit), limit * len(results)
+    if args.outfile:
+        # Write beside the target and swap it in only when rows came back, so a quiet window
+        # leaves the previous CSV untouched
+        tmp = f"{args.outfile}.{os.getpid()}.tmp"
+        try:
+            # 1 MiB buffer: query texts make rows large, so the default 8 KiB means a write() every few rows
+            with open(tmp, "w", newline="", buffering=1 << 20) as fp:
+                ranked = _top_n_most_expensive(_write_csv(fp, _iter_all_locations(results, page_size)), n, max_rows)
+            if ranked:
+                os.replace(tmp, args.outfile)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    else:
+        # Per-location top rows merged across locations
+        ranked = _top_n_most_expensive(_iter_all_locations(results, page_size), n, max_rows)
+
+    if not ranked:
+        print("No jobs found in the specified window/locations.")
         return 0
 
+    top = ranked[0]
     print("Most expensive query in the window:")
     print(f"  Location: {top.location}")
     print(f"  Job ID:   {top.job_id}")
@@ -188,7 +332,7 @@ def main() -> int:
     print(top.query or "")
 
     # Print top-N most expensive queries as requested
-    topn_jobs = _top_n_most_expensive(all_jobs, args.topn)
+    topn_jobs = ranked[:args.topn] if args.topn > 0 else []
     if topn_jobs:
         print(f"\nTop {len(topn_jobs)} most expensive queries:")
         for i, j in enumerate(topn_jobs, start=1):
@@ -201,7 +345,8 @@ def main() -> int:
             print("    Query:")
             print(j.query or "")
 
-    print(f"\nWrote job CSV to: {os.path.abspath(args.outfile)}")
+    if args.outfile:
+        print(f"\nWrote job CSV to: {os.path.abspath(args.outfile)}")
     return 0
 
 
@@ -10,7 +10,7 @@ IMPORTANT:
 
 Strategy (safe baseline):
 - Creates (or ensures) a dataset.
-- Creates two tables with a fixed schema.
+- Creates two tables with a fixed schema, partitioned by DATE(ts) and clustered by id.
 - Uses CREATE TABLE AS SELECT with UNNEST(GENERATE_ARRAY(...)) to generate rows
   whose average size is controlled via a payload column.
 - Supports chunked writes so you can scale up deliberately.
@@ -24,8 +24,10 @@ Costs/limits to keep in mind:
 from __future__ import annotations
 
 import argparse
+import functools
 import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
 
 from google.cloud import bigquery
@@ -77,13 +79,25 @@ def parse_args() -> argparse.Namespace:
     return p.parse_args()
 
 
+# (project, dataset) pairs already ensured in this process
+_KNOWN_DATASETS: set[tuple[str, str]] = set()
+
+
+@functools.lru_cache(maxsize=8)
+def _client(project: str) -> bigquery.Client:
+    """Return a shared BigQuery client (and its authorized HTTP session) for ``project``."""
+    return bigquery.Client(project=project)
+
+
 def ensure_dataset(client: bigquery.Client, dataset_id: str, location: str) -> None:
+    key = (client.project, dataset_id)
+    if key in _KNOWN_DATASETS:
+        return
     ds_ref = bigquery.Dataset(f"{client.project}.{dataset_id}")
     ds_ref.location = location
-    try:
-        client.get_dataset(ds_ref)
-    except Exception:
-        client.create_dataset(ds_ref, exists_ok=True)
+    # Idempotent create: a single call whether or not the dataset already exists
+    client.create_dataset(ds_ref, exists_ok=True)
+    _KNOWN_DATASETS.add(key)
 
 
 def drop_table_if_exists(client: bigquery.Client, full_table_id: str) -> None:
@@ -96,27 +110,39 @@ def compute_rows_for_bytes(target_bytes: float, payload_bytes: int) -> int:
     return max(1, int(target_bytes // avg_row))
 
 
+# Day partitions plus id clustering so reads filtered on ts or id prune storage
+_LAYOUT = "PARTITION BY DATE(ts) CLUSTER BY id"
+
+# Evaluated once per chunk script and referenced by every row
+_TS_DECLARE = "DECLARE ts_const TIMESTAMP DEFAULT TIMESTAMP_TRUNC(CURRENT_TIMESTAMP(), SECOND);"
+
+
 def ctas_chunk_sql(dataset: str, table: str, rows: int, payload_bytes: int, append: bool) -> str:
     # Generate synthetic data with controlled payload size; id cycles from 1..rows
+    # The payload string is built once in a one-row CTE and cross-joined, not per row.
     # Avoid BigQuery's GENERATE_ARRAY element caps by using a 2D grid when rows are large.
     write_clause = "CREATE TABLE" if not append else "INSERT INTO"
     target = f"`{dataset}.{table}`"
     max_single_array = 9_000_000  # stay under ~10M element limit per array
 
     if rows <= max_single_array:
-        prefix = f"{write_clause} {target} AS" if not append else f"{write_clause} {target}"
+        prefix = f"{write_clause} {target} {_LAYOUT} AS" if not append else f"{write_clause} {target}"
         return f"""
+        {_TS_DECLARE}
         {prefix}
         WITH gen AS (
           SELECT id
           FROM UNNEST(GENERATE_ARRAY(1, {rows})) AS id
+        ),
+        pay AS (
+          SELECT REPEAT('x', {payload_bytes}) AS p
         )
         SELECT
           id,
-          CONCAT('user_', CAST(MOD(id, 100000) AS STRING)) AS user,
-          TIMESTAMP_TRUNC(CURRENT_TIMESTAMP(), SECOND) AS ts,
-          REPEAT('x', {payload_bytes}) AS payload
-        FROM gen
+          FORMAT('user_%d', MOD(id, 100000)) AS user,
+          TIMESTAMP_ADD(ts_const, INTERVAL MOD(id, 86400) SECOND) AS ts,
+          pay.p AS payload
+        FROM gen CROSS JOIN pay
         """.strip()
 
     # Use 2D grid: rows_i * rows_j >= rows, each dimension kept small
@@ -131,8 +157,9 @@ def ctas_chunk_sql(dataset: str, table: str, rows: int, payload_bytes: int, appe
     rows_j = max(1, rows_j)
 
     id_expr = f"(i - 1) * {rows_j} + j"
-    prefix = f"{write_clause} {target} AS" if not append else f"{write_clause} {target}"
+    prefix = f"{write_clause} {target} {_LAYOUT} AS" if not append else f"{write_clause} {target}"
     return f"""
+    {_TS_DECLARE}
     {prefix}
     WITH gen_i AS (
       SELECT i FROM UNNEST(GENERATE_ARRAY(1, {rows_i})) AS i
@@ -144,13 +171,16 @@ def ctas_chunk_sql(dataset: str, table: str, rows: int, payload_bytes: int, appe
       SELECT {id_expr} AS id
       FROM gen_i CROSS JOIN gen_j
       WHERE {id_expr} <= {rows}
+    ),
+    pay AS (
+      SELECT REPEAT('x', {payload_bytes}) AS p
     )
     SELECT
       id,
-      CONCAT('user_', CAST(MOD(id, 100000) AS STRING)) AS user,
-      TIMESTAMP_TRUNC(CURRENT_TIMESTAMP(), SECOND) AS ts,
-      REPEAT('x', {payload_bytes}) AS payload
-    FROM gen
+      FORMAT('user_%d', MOD(id, 100000)) AS user,
+      TIMESTAMP_ADD(ts_const, INTERVAL MOD(id, 86400) SECOND) AS ts,
+      pay.p AS payload
+    FROM gen CROSS JOIN pay
     """.strip()
 
 
@@ -159,35 +189,37 @@ def generate_table(client: bigquery.Client, dataset: str, table: str, target_gib
     chunk_bytes = min(target_bytes, max(1, int(chunk_gib * (1024 ** 3))))
     chunks = int(math.ceil(target_bytes / chunk_bytes))
     full_table_id = f"{client.project}.{dataset}.{table}"
+    # Every chunk has the same size, so the row count and SQL are loop-invariant
+    rows = compute_rows_for_bytes(chunk_bytes, payload_bytes)
+    total_rows = rows * chunks
+
+    if not do_run:
+        # Plan only: print the chunk schedule without touching the table or building any SQL
+        for i in range(chunks):
+            print(f"[PLAN] {'APPEND' if i > 0 else 'CREATE'} {full_table_id} chunk {i+1}/{chunks}: ~{chunk_gib:.2f} GiB, rows≈{rows}")
+        return total_rows, target_gib
+
+    sql_create = ctas_chunk_sql(dataset, table, rows, payload_bytes, append=False)
+    sql_append = ctas_chunk_sql(dataset, table, rows, payload_bytes, append=True)
     # Ensure a clean start: drop existing so first chunk can CREATE TABLE
     drop_table_if_exists(client, full_table_id)
-
-    total_rows = 0
     for i in range(chunks):
-        rows = compute_rows_for_bytes(chunk_bytes, payload_bytes)
         append = i > 0
-        sql = ctas_chunk_sql(dataset, table, rows, payload_bytes, append)
-        if not do_run:
-            print(f"[PLAN] {'APPEND' if append else 'CREATE'} {full_table_id} chunk {i+1}/{chunks}: ~{chunk_gib:.2f} GiB, rows≈{rows}")
-        else:
-            job = client.query(sql)
-            job.result()
-            print(f"[DONE]  {'APPEND' if append else 'CREATE'} {full_table_id} chunk {i+1}/{chunks}: rows≈{rows}")
-        total_rows += rows
+        job = client.query(sql_append if append else sql_create)
+        job.result()
+        print(f"[DONE]  {'APPEND' if append else 'CREATE'} {full_table_id} chunk {i+1}/{chunks}: rows≈{rows}")
     return total_rows, target_gib
 
 
 def main() -> int:
     args = parse_args()
-    client = bigquery.Client(project=args.project)
+    client = _client(args.project)
 
     if args.target_gib >= 1024 and not args.force_really_big:
         print("Refusing to proceed: --target_gib >= 1024 requires --force_really_big.")
         print("Use smaller sizes first, or set --force_really_big if you really understand the costs.")
         return 2
 
-    ensure_dataset(client, args.dataset, args.location)
-
     # Plan phase (always printed)
     print(f"Project:  {args.project}")
     print(f"Dataset:  {args.dataset} ({args.location})")
@@ -198,26 +230,26 @@ def main() -> int:
     else:
         print("\nCONFIRMED: proceeding to create data.")
 
-    # Execute (or plan) table 1
-    rows1, gib1 = generate_table(
-        client,
+    kwargs = dict(
         dataset=args.dataset,
-        table=args.table1,
-        target_gib=args.target_gib,
-        chunk_gib=args.chunk_gib,
-        payload_bytes=args.payload_bytes,
-        do_run=args.confirm,
-    )
-    # Execute (or plan) table 2
-    rows2, gib2 = generate_table(
-        client,
-        dataset=args.dataset,
-        table=args.table2,
         target_gib=args.target_gib,
         chunk_gib=args.chunk_gib,
         payload_bytes=args.payload_bytes,
         do_run=args.confirm,
     )
+    if not args.confirm:
+        # Plan only: nothing is created, dropped or submitted
+        rows1, gib1 = generate_table(client, table=args.table1, **kwargs)
+        rows2, gib2 = generate_table(client, table=args.table2, **kwargs)
+    else:
+        ensure_dataset(client, args.dataset, args.location)
+        # The two tables are independent: run their chunk sequences side by side (chunks within a
+        # table stay serial since each INSERT appends to the table the previous chunk created).
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fut1 = ex.submit(generate_table, client, table=args.table1, **kwargs)
+            fut2 = ex.submit(generate_table, client, table=args.table2, **kwargs)
+            rows1, gib1 = fut1.result()
+            rows2, gib2 = fut2.result()
 
     print("\nSummary:")
     print(f"  {args.table1}: rows≈{rows1}, size target≈{gib1:.2f} GiB")
@@ -84,7 +84,7 @@ job=rows[0]; job_id=job['job_id']; sql=job['query']
 qa=query_analysis_tool(QueryAnalysisInput(sql=sql, project=proj, job_id=job_id))
 md=qa.metadata_file
 out='./analysis_out/forensic_report.md'
-res=forensic_agent_tool(ForensicInput(md_path=md, output_path=out))
+res=forensic_agent_tool(ForensicInput(md_path=md, output_path=out, top_sql=sql))
 print('Report ->', os.path.abspath(res.report_path))
 print('\nPREVIEW:\n', res.text_preview)
 PY
@@ -97,7 +97,7 @@ import os, csv, re, shutil
 from google.cloud import bigquery
 from adk_app.tools.query_analysis_tool import query_analysis_tool
 from adk_app.schemas import QueryAnalysisInput
-from adk_app.tools.forensic_agent_tool import forensic_agent_tool
+from adk_app.tools.forensic_agent_tool import forensic_agent_tool_batch
 from adk_app.schemas import ForensicInput
 proj=os.environ['GOOGLE_CLOUD_PROJECT']
 csv_path='./bq_job_stats_today.csv'
@@ -110,12 +110,17 @@ rows.sort(key=lambda r:(int(r.get('total_bytes_billed') or 0), int(r.get('total_
 rows=rows[:10]
 os.makedirs('./analysis_out', exist_ok=True)
 bundle='./analysis_out/forensic_report_top10.md'
-paths=[]
+inputs=[]
 for r in rows:
   job_id=r['job_id']; sql=r['query']
   qa=query_analysis_tool(QueryAnalysisInput(sql=sql, project=proj, job_id=job_id))
-  fr=forensic_agent_tool(ForensicInput(md_path=qa.metadata_file, output_path=f'./analysis_out/forensic_report_{job_id}.md'))
-  paths.append((job_id, fr.report_path))
+  # The schema report path is reused per call; keep a per-job copy for the batched forensic run
+  md=f'./analysis_out/schema_report_{job_id}.md'
+  if qa.metadata_file: shutil.copyfile(qa.metadata_file, md)
+  inputs.append(ForensicInput(md_path=md, output_path=f'./analysis_out/forensic_report_{job_id}.md', top_sql=sql))
+# One event loop, up to FORENSIC_MAX_CONCURRENCY reports in flight
+results=forensic_agent_tool_batch(inputs)
+paths=[(r['job_id'], fr.report_path) for r, fr in zip(rows, results)]
 with open(bundle,'w') as out:
   out.write('---\nformat: bq_forensic_bundle\nversion: 1\nproject: '+proj+'\n---\n\n')
   out.write('# Forensic Reports: Top 10 Queries\n')
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from adk_bq_audit import audit
+
+
+class _Row:
+    def __init__(self, *vals):
+        self._vals = vals
+
+    def values(self):
+        return self._vals
+
+
+class _Rows:
+    """Mimics RowIterator: starting the Arrow path marks it started, after which plain iteration fails."""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._started = False
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        self._started = True
+        bqstorage_client.create_read_session()
+        yield from ()
+
+    def __iter__(self):
+        if self._started:
+            raise ValueError("Iterator has already started")
+        self._started = True
+        return iter(self._rows)
+
+
+class _Job:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def result(self, page_size=None):
+        return _Rows(self._rows)
+
+
+class IterJobStatsTest(unittest.TestCase):
+    def test_falls_back_to_rest_when_storage_read_fails(self):
+        rows = [
+            _Row("j1", "a@x", "2024-01-01", "2024-01-01", 10, 20, 30, "SELECT", "SELECT 1"),
+            _Row("j2", "b@x", "2024-01-02", "2024-01-02", 1, 2, 3, "SELECT", "SELECT 2"),
+        ]
+        storage = mock.Mock()
+        storage.create_read_session.side_effect = PermissionError("bigquery.readsessions.create denied")
+        with mock.patch.object(audit, "_get_bqstorage_client", return_value=storage):
+            stats = list(audit._iter_job_stats("US", _Job(rows), page_size=100))
+        self.assertEqual([s.job_id for s in stats], ["j1", "j2"])
+        self.assertEqual(stats[0].location, "US")
+        self.assertEqual(stats[0].total_bytes_billed, 20)
+        storage.create_read_session.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()